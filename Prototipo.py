@@ -1,32 +1,173 @@
+import os
+import sys
+import json
+import socket
+import argparse
+import tempfile
+import threading
+
+class SingleInstance:
+    """Instancia única: socket Unix del reproductor en ejecución"""
+    
+    MAX_MESSAGE = 1 << 20
+    
+    def __init__(self):
+        self.path = self.socket_path()
+        self.server = None
+    
+    @staticmethod
+    def socket_path():
+        """Socket en XDG_RUNTIME_DIR o, si no existe, en un directorio privado de /tmp"""
+        folder = os.environ.get('XDG_RUNTIME_DIR')
+        if not folder or not os.path.isdir(folder):
+            folder = os.path.join(tempfile.gettempdir(), f"cardamomo-{os.getuid()}")
+            os.makedirs(folder, mode=0o700, exist_ok=True)
+            # Un directorio ajeno permitiría suplantar al reproductor
+            if os.stat(folder).st_uid != os.getuid():
+                return None
+        return os.path.join(folder, "cardamomo.sock")
+    
+    def send(self, paths, commands, probe=False):
+        """Entrega rutas y órdenes al reproductor abierto (False si no hay ninguno)"""
+        if self.path is None:
+            return False
+        
+        message = json.dumps({
+            'paths': [os.path.abspath(path) for path in paths],
+            'commands': list(commands),
+            'probe': probe
+        }).encode('utf-8')
+        
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+                client.settimeout(1.0)
+                client.connect(self.path)
+                # Sin respuesta: el mensaje queda en el socket aunque el
+                # reproductor aún esté arrancando
+                client.sendall(message)
+            return True
+        except OSError:
+            return False
+    
+    def listen(self):
+        """Reclama el socket (False si otra instancia lo tiene)"""
+        if self.path is None:
+            return True
+        
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            server.bind(self.path)
+        except OSError:
+            # Socket de una instancia que terminó sin cerrarlo: se reemplaza
+            if self.send([], [], probe=True):
+                server.close()
+                return False
+            try:
+                os.unlink(self.path)
+                server.bind(self.path)
+            except OSError as e:
+                server.close()
+                print(f"⚠ Instancia única desactivada: {e}")
+                return True
+        
+        server.listen(8)
+        self.server = server
+        return True
+    
+    def serve(self, handler):
+        """Atiende los mensajes de otras instancias en un hilo propio"""
+        if self.server is not None:
+            threading.Thread(target=self.run, args=(handler,), daemon=True).start()
+    
+    def run(self, handler):
+        """Lee un mensaje JSON por conexión"""
+        while self.server is not None:
+            try:
+                connection, _ = self.server.accept()
+            except OSError:
+                break
+            
+            try:
+                with connection:
+                    connection.settimeout(2.0)
+                    chunks = []
+                    size = 0
+                    while size < self.MAX_MESSAGE:
+                        chunk = connection.recv(65536)
+                        if not chunk:
+                            break
+                        chunks.append(chunk)
+                        size += len(chunk)
+                
+                message = json.loads(b''.join(chunks).decode('utf-8'))
+                if message.get('probe'):
+                    # Comprobación de otra instancia al arrancar, no un pedido
+                    continue
+                handler(message.get('paths', []), message.get('commands', []))
+                
+            except (OSError, ValueError, AttributeError) as e:
+                print(f"⚠ Mensaje de otra instancia descartado: {e}")
+    
+    def close(self):
+        """Libera el socket"""
+        server, self.server = self.server, None
+        if server is not None:
+            server.close()
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+
+def parse_args(argv=None):
+    """Argumentos de línea de comandos"""
+    parser = argparse.ArgumentParser(description="Cardamomo Pro")
+    parser.add_argument('paths', nargs='*', help="archivos o carpetas para agregar")
+    parser.add_argument('--play-pause', dest='commands', action='append_const', const='play-pause',
+                        help="reproducir o pausar")
+    parser.add_argument('--next', dest='commands', action='append_const', const='next',
+                        help="siguiente canción")
+    parser.add_argument('--prev', dest='commands', action='append_const', const='prev',
+                        help="canción anterior")
+    parser.add_argument('--new-instance', action='store_true',
+                        help="no entregar los argumentos a un reproductor ya abierto")
+    args = parser.parse_args(argv)
+    args.commands = args.commands or []
+    return args
+
+# Relanzamiento rápido: si ya hay un reproductor abierto se le entregan los
+# argumentos y se sale antes de importar pygame, customtkinter y numpy
+if __name__ == "__main__":
+    ARGS = parse_args()
+    if not ARGS.new_instance and SingleInstance().send(ARGS.paths, ARGS.commands):
+        sys.exit(0)
+
 import pygame
 import customtkinter as ctk
 import tkinter as tk
 from tkinter import filedialog, messagebox
-import threading
+import queue
 import time
-import os
 import random
 import numpy as np
-import sys
-import json
+import shutil
+import wave
+import subprocess
 import struct
-from collections import deque
+import hashlib
+import mmap
+import zlib
+from abc import ABC, abstractmethod
+from array import array
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote, unquote, urlsplit
+from xml.sax.saxutils import escape
+import xml.etree.ElementTree as ET
 from mutagen import File
 from mutagen.mp3 import MP3
 from mutagen.flac import FLAC
 from mutagen.oggvorbis import OggVorbis
 
-# CONFIGURACIÓN DE PYGAME
-if not pygame.get_init():
-    pygame.mixer.pre_init(
-        frequency=44100,
-        size=-16,
-        channels=2,
-        buffer=4096,
-        allowedchanges=0
-    )
-    pygame.init()
-
 os.environ['PYGAME_HIDE_SUPPORT_PROMPT'] = "hide"
 
 class AudioAnalyzer:
@@ -47,6 +188,7 @@ class AudioAnalyzer:
         self.energy = 0.0
         self.beat_counter = 0
         self.last_beat = time.time()
+        self.beat_pulse = 1.0
         
         # Colores en gradiente
         self.colors = self.create_color_gradient()
@@ -92,7 +234,7 @@ class AudioAnalyzer:
             colors.append(f"#{r:02x}{g:02x}{b:02x}")
         return colors
     
-    def simulate_audio_data(self, is_playing, is_paused, volume=1.0):
+    def simulate_audio_data(self, is_playing, is_paused, volume=1.0, beat_times=None, position=0.0):
         """Simula datos de audio con patrones realistas"""
         if not is_playing or is_paused:
             # Desvanecer cuando no hay música
@@ -105,10 +247,17 @@ class AudioAnalyzer:
             current_time = time.time()
             t = current_time * 2  # Velocidad base
             
-            # Detectar "beats" cada 0.5 segundos aproximadamente
-            if current_time - self.last_beat > 0.5:
+            if beat_times is not None and len(beat_times) > 0:
+                # Beats reales: búsqueda binaria de la posición en la rejilla
+                index = int(np.searchsorted(beat_times, position, side='right'))
+                self.beat_counter = index
+                since_beat = position - beat_times[index - 1] if index > 0 else 1.0
+                self.beat_pulse = float(np.exp(-6.0 * since_beat))
+            elif current_time - self.last_beat > 0.5:
+                # Sin análisis: "beats" cada 0.5 segundos aproximadamente
                 self.beat_counter += 1
                 self.last_beat = current_time
+                self.beat_pulse = 1.0
             
             # Generar datos basados en múltiples patrones
             target = np.zeros(self.num_bars)
@@ -134,6 +283,7 @@ class AudioAnalyzer:
                     rhythm_effect = 0.4 * (1 - x) if i < self.num_bars // 4 else 0
                 elif self.beat_counter % 2 == 0:  # Cada 2 beats, énfasis en medios
                     rhythm_effect = 0.3 * np.exp(-8 * (x - 0.5) ** 2)
+                rhythm_effect *= self.beat_pulse
                 
                 # **Ruido controlado** (más en agudos, menos en graves)
                 noise_factor = 0.1 + x * 0.2  # Más ruido en frecuencias altas
@@ -185,6 +335,1023 @@ class AudioAnalyzer:
         
         return self.current_heights, self.colors
 
+class AudioDecoder:
+    """Decodificador de audio a bloques PCM"""
+    
+    # Tamaño de muestra WAV -> tipo de NumPy (8 bits es sin signo)
+    WAVE_DTYPES = {1: np.uint8, 2: np.int16, 4: np.int32}
+    
+    def __init__(self, sample_rate=44100, channels=2):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.ffmpeg = shutil.which("ffmpeg")
+    
+    def can_stream(self, ruta):
+        """Indica si la canción se puede decodificar en streaming"""
+        if self.ffmpeg:
+            return True
+        
+        # Sin ffmpeg solo se admiten WAV que no necesiten remuestreo
+        if os.path.splitext(ruta)[1].lower() != '.wav':
+            return False
+        try:
+            with wave.open(ruta, 'rb') as wav:
+                return (wav.getframerate() == self.sample_rate and
+                        wav.getsampwidth() in self.WAVE_DTYPES)
+        except (OSError, EOFError, wave.Error):
+            return False
+    
+    def blocks(self, ruta, block_frames=44100, start=0.0, duration=None):
+        """Genera bloques float32 de forma (frames, canales)"""
+        if self.ffmpeg:
+            yield from self.ffmpeg_blocks(ruta, block_frames, start, duration)
+        elif self.can_stream(ruta):
+            yield from self.wave_blocks(ruta, block_frames, start, duration)
+        else:
+            raise RuntimeError(f"ffmpeg no está instalado: no se puede decodificar {os.path.basename(ruta)}")
+    
+    def ffmpeg_blocks(self, ruta, block_frames, start, duration):
+        """Decodifica en streaming con ffmpeg (nunca carga todo el PCM)"""
+        command = [self.ffmpeg, "-v", "quiet", "-nostdin"]
+        if start > 0:
+            command += ["-ss", f"{start:.3f}"]
+        command += ["-i", ruta]
+        if duration is not None:
+            command += ["-t", f"{duration:.3f}"]
+        command += ["-f", "s16le", "-ac", str(self.channels), "-ar", str(self.sample_rate), "-"]
+        
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        block_bytes = block_frames * self.channels * 2
+        try:
+            while True:
+                data = process.stdout.read(block_bytes)
+                if len(data) < self.channels * 2:
+                    break
+                data = data[:len(data) - len(data) % (self.channels * 2)]
+                pcm = np.frombuffer(data, dtype=np.int16).reshape(-1, self.channels)
+                yield pcm.astype(np.float32) / 32768.0
+            
+            # Un fallo de ffmpeg (archivo ilegible, montaje caído) no debe
+            # pasar por una canción vacía
+            if process.wait() != 0:
+                raise RuntimeError(f"ffmpeg terminó con código {process.returncode}")
+        finally:
+            process.kill()
+            process.wait()
+    
+    def wave_blocks(self, ruta, block_frames, start, duration):
+        """Respaldo sin ffmpeg: lee el WAV por bloques (nunca carga todo el PCM)"""
+        with wave.open(ruta, 'rb') as wav:
+            channels = wav.getnchannels()
+            dtype = self.WAVE_DTYPES[wav.getsampwidth()]
+            
+            first = min(int(start * self.sample_rate), wav.getnframes())
+            remaining = wav.getnframes() - first
+            if duration is not None:
+                remaining = min(remaining, int(duration * self.sample_rate))
+            wav.setpos(first)
+            
+            while remaining > 0:
+                data = wav.readframes(min(block_frames, remaining))
+                if not data:
+                    break
+                pcm = np.frombuffer(data, dtype=dtype).reshape(-1, channels)
+                remaining -= len(pcm)
+                
+                if dtype == np.uint8:
+                    block = (pcm.astype(np.float32) - 128.0) / 128.0
+                else:
+                    block = pcm.astype(np.float32) / float(np.iinfo(dtype).max + 1)
+                
+                # Ajustar al número de canales de salida
+                if channels < self.channels:
+                    block = np.repeat(block[:, :1], self.channels, axis=1)
+                elif channels > self.channels:
+                    block = block[:, :self.channels]
+                yield block
+
+class ChannelStream:
+    """Alimenta un canal del mixer con bloques PCM desde un hilo propio"""
+    
+    def __init__(self, channel, blocks, gain=None, process=None, prefill=2):
+        self.channel = channel
+        self.blocks = blocks
+        self.gain = gain
+        self.process = process
+        self.prefill = prefill
+        
+        # Se llama (desde este hilo) cuando empieza a sonar el primer bloque
+        self.on_first_audio = None
+        
+        self.started = threading.Event()
+        self.finished = threading.Event()
+        self.stopped = False
+        self.paused = False
+        
+        # Empieza a decodificar ya, aunque aún no suene
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+    
+    def start(self):
+        """Empieza a sonar (los primeros bloques ya están listos)"""
+        self.started.set()
+    
+    def pause(self):
+        self.paused = True
+        self.channel.pause()
+    
+    def resume(self):
+        self.paused = False
+        self.channel.unpause()
+    
+    def stop(self):
+        self.stopped = True
+        self.started.set()
+        self.channel.stop()
+    
+    def run(self):
+        """Decodifica por adelantado y encola en el canal sin bloquear a Tk"""
+        pending = deque()
+        offset = 0
+        exhausted = False
+        
+        try:
+            while not self.stopped:
+                if not exhausted and len(pending) < self.prefill:
+                    block = next(self.blocks, None)
+                    if block is None:
+                        exhausted = True
+                        continue
+                    
+                    if self.process is not None:
+                        block = self.process(block)
+                    if self.gain is not None:
+                        block = block * self.gain(offset, len(block))[:, None]
+                    offset += len(block)
+                    
+                    pcm = np.clip(block * 32767.0, -32768, 32767).astype(np.int16)
+                    pending.append(pygame.sndarray.make_sound(np.ascontiguousarray(pcm)))
+                    continue
+                
+                if not self.started.is_set():
+                    self.started.wait(0.05)
+                elif self.paused:
+                    time.sleep(0.02)
+                elif pending and not self.channel.get_busy():
+                    self.channel.play(pending.popleft())
+                    if self.on_first_audio is not None:
+                        self.on_first_audio()
+                        self.on_first_audio = None
+                elif pending and self.channel.get_queue() is None:
+                    self.channel.queue(pending.popleft())
+                elif exhausted and not pending and not self.channel.get_busy():
+                    break
+                else:
+                    time.sleep(0.02)
+                    
+        except Exception as e:
+            print(f"✗ Error en canal de audio: {e}")
+        finally:
+            self.blocks.close()
+            self.finished.set()
+
+class Equalizer:
+    """Ecualizador gráfico de 10 bandas (biquads de pico en cascada)"""
+    
+    FREQUENCIES = (31, 62, 125, 250, 500, 1000, 2000, 4000, 8000, 16000)
+    PRESETS = {
+        "Plano": [0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
+        "Graves": [6, 5, 4, 2, 0, 0, 0, 0, 0, 0],
+        "Agudos": [0, 0, 0, 0, 0, 1, 2, 4, 5, 6],
+        "Voz": [-2, -2, -1, 1, 3, 4, 3, 1, 0, -1],
+        "Rock": [4, 3, 2, 0, -1, -1, 1, 2, 3, 4],
+        "Electrónica": [5, 4, 1, 0, -2, 1, 0, 1, 4, 5],
+    }
+    
+    # Respuestas por diseño: una por tamaño de bloque (salida y crossfade)
+    MAX_RESPONSES = 2
+    
+    def __init__(self, sample_rate=44100, q=1.41, gains=None, enabled=False):
+        self.sample_rate = sample_rate
+        self.q = q
+        self.gains = list(gains or self.PRESETS["Plano"])
+        self.enabled = enabled
+        
+        # Diseño compartido por todos los flujos: (versión, {banda: coeficientes}, respuestas)
+        self.design = (0, self.compute_coefficients(), OrderedDict())
+        self.responses_lock = threading.Lock()
+        
+        # Medición del coste por bloque
+        self.blocks_processed = 0
+        self.frames_processed = 0
+        self.total_time = 0.0
+        self.max_ratio = 0.0
+    
+    def set_gain(self, band, gain):
+        """Cambia la ganancia (dB) de una banda"""
+        gain = round(float(gain), 1)
+        if self.gains[band] == gain:
+            return
+        self.gains[band] = gain
+        self.design = (self.design[0] + 1, self.compute_coefficients(), OrderedDict())
+    
+    def set_gains(self, gains):
+        """Cambia todas las ganancias a la vez (presets)"""
+        gains = [round(float(gain), 1) for gain in gains]
+        if gains == self.gains:
+            return
+        self.gains = gains
+        self.design = (self.design[0] + 1, self.compute_coefficients(), OrderedDict())
+    
+    def compute_coefficients(self):
+        """Coeficientes normalizados (b0, b1, b2, a1, a2) de cada banda activa"""
+        coefficients = {}
+        for band, (freq, gain) in enumerate(zip(self.FREQUENCIES, self.gains)):
+            if abs(gain) < 0.05 or freq >= self.sample_rate / 2:
+                continue  # Banda plana: no se procesa
+            
+            amplitude = 10 ** (gain / 40)
+            w0 = 2 * np.pi * freq / self.sample_rate
+            alpha = np.sin(w0) / (2 * self.q)
+            cos_w0 = np.cos(w0)
+            
+            b = np.array([1 + alpha * amplitude, -2 * cos_w0, 1 - alpha * amplitude])
+            a = np.array([1 + alpha / amplitude, -2 * cos_w0, 1 - alpha / amplitude])
+            coefficients[band] = np.concatenate((b / a[0], a[1:] / a[0]))
+        
+        return coefficients
+    
+    def create_filter(self, block_frames):
+        """Filtro con estado propio para un flujo de audio"""
+        return EqualizerFilter(self, block_frames)
+    
+    def responses(self, design, frames):
+        """Respuestas al impulso de cada banda truncadas al tamaño de bloque"""
+        with self.responses_lock:
+            version, coefficients, cache = design
+            if frames in cache:
+                cache.move_to_end(frames)
+                return cache[frames]
+            
+            entry = self.compute_responses(coefficients, frames)
+            cache[frames] = entry
+            while len(cache) > self.MAX_RESPONSES:
+                cache.popitem(last=False)
+            return entry
+    
+    def compute_responses(self, coefficients, frames):
+        """Espectros de cada banda para convolucionar bloques de 'frames' muestras"""
+        
+        fft_size = 1 << int(np.ceil(np.log2(2 * frames)))
+        grid_size = max(1 << 16, fft_size)
+        z = np.exp(-1j * np.linspace(0, np.pi, grid_size // 2 + 1))
+        
+        bands = []
+        for band, coeffs in sorted(coefficients.items()):
+            b0, b1, b2, a1, a2 = coeffs
+            denominator = 1 + a1 * z + a2 * z ** 2
+            numerator = b0 + b1 * z + b2 * z ** 2
+            
+            # Muestreo denso en frecuencia: el aliasing temporal es despreciable
+            impulse = np.fft.irfft(numerator / denominator, grid_size)[:frames]
+            decay = np.fft.irfft(1 / denominator, grid_size)[:frames]
+            bands.append((band, coeffs, np.fft.rfft(impulse, fft_size), decay))
+        
+        return fft_size, bands
+    
+    def record(self, elapsed, frames):
+        """Registra el coste de un bloque"""
+        self.blocks_processed += 1
+        self.frames_processed += frames
+        self.total_time += elapsed
+        self.max_ratio = max(self.max_ratio, elapsed / (frames / self.sample_rate))
+        
+        if elapsed > 0.25 * frames / self.sample_rate:
+            print(f"⚠ Ecualizador lento: {elapsed * 1000:.1f} ms para {frames} muestras")
+    
+    def report(self):
+        """Resumen del coste medido"""
+        if not self.blocks_processed:
+            return "Ecualizador: sin bloques procesados"
+        
+        per_block = self.total_time / self.blocks_processed * 1000
+        block_ms = self.frames_processed / self.blocks_processed / self.sample_rate * 1000
+        load = self.total_time / (self.frames_processed / self.sample_rate) * 100
+        return (f"Ecualizador: {per_block:.2f} ms por bloque de {block_ms:.0f} ms "
+                f"({load:.1f}% de media, pico {self.max_ratio * 100:.1f}%)")
+
+class EqualizerFilter:
+    """Estado de filtrado de un flujo (el diseño se comparte con el ecualizador)"""
+    
+    def __init__(self, equalizer, block_frames):
+        self.equalizer = equalizer
+        self.block_frames = block_frames
+        self.version = None
+        
+        # Estado por banda: x[n-1], x[n-2], y[n-1], y[n-2] de cada canal
+        self.state = np.zeros((len(equalizer.FREQUENCIES), 4, 2))
+    
+    def process(self, block):
+        """Filtra un bloque estéreo conservando el estado entre bloques"""
+        design = self.equalizer.design
+        version, coefficients = design[:2]
+        
+        if version != self.version:
+            # Las bandas que se apagan pierden su estado
+            for band in range(len(self.state)):
+                if band not in coefficients:
+                    self.state[band] = 0.0
+            self.version = version
+        
+        if not coefficients:
+            return block
+        
+        # El cálculo de las respuestas (al mover un ajuste) también se mide
+        start = time.perf_counter()
+        
+        # El último bloque de cada canción es más corto: se rellena con ceros
+        # hasta el tamaño nominal para reutilizar las mismas respuestas. El
+        # filtro es causal, así que las primeras 'frames' salidas no cambian
+        frames = len(block)
+        size = max(frames, self.block_frames)
+        fft_size, bands = self.equalizer.responses(design, size)
+        
+        signal = np.zeros((size, block.shape[1]))
+        signal[:frames] = block
+        
+        for band, (b0, b1, b2, a1, a2), spectrum, decay in bands:
+            # Respuesta a estado cero: convolución exacta (bloque de longitud finita)
+            output = np.fft.irfft(np.fft.rfft(signal, fft_size, axis=0) * spectrum[:, None],
+                                  fft_size, axis=0)[:size]
+            
+            # Respuesta debida al estado del bloque anterior
+            x1, x2, y1, y2 = self.state[band]
+            e0 = b1 * x1 + b2 * x2 - a1 * y1 - a2 * y2
+            e1 = b2 * x1 - a2 * y1
+            output += decay[:size, None] * e0
+            output[1:] += decay[:size - 1, None] * e1
+            
+            # El estado sale de la parte válida, no del relleno
+            history_in = np.vstack((x2, x1, signal[:frames]))
+            history_out = np.vstack((y2, y1, output[:frames]))
+            self.state[band] = (history_in[-1], history_in[-2], history_out[-1], history_out[-2])
+            signal = output
+        
+        # Se mide contra el tamaño procesado: el relleno cuesta como un bloque completo
+        self.equalizer.record(time.perf_counter() - start, size)
+        return signal[:frames].astype(np.float32)
+
+class PlaybackOutput:
+    """Salida principal: pygame.mixer.music o, con ecualizador, un canal por bloques"""
+    
+    def __init__(self, decoder, channel, equalizer, block_seconds=0.25):
+        self.decoder = decoder
+        self.channel = channel
+        self.equalizer = equalizer
+        self.block_frames = int(decoder.sample_rate * block_seconds)
+        
+        self.stream = None
+        self.start_at = 0.0
+    
+    def create_process(self, block_frames=None):
+        """Etapa DSP para un flujo nuevo (o None si no hay ecualizador)"""
+        if not self.equalizer.enabled:
+            return None
+        return self.equalizer.create_filter(block_frames or self.block_frames).process
+    
+    def load(self, ruta, start=0.0):
+        """Prepara una canción (con ecualizador ya empieza a decodificar)"""
+        self.stop()
+        self.start_at = start
+        
+        # Sin decodificador en streaming la canción suena sin ecualizador
+        if self.equalizer.enabled and self.decoder.can_stream(ruta):
+            self.stream = ChannelStream(
+                self.channel,
+                self.decoder.blocks(ruta, self.block_frames, start=start),
+                process=self.create_process()
+            )
+        else:
+            pygame.mixer.music.load(ruta)
+    
+    def play(self, on_first_audio=None):
+        """Empieza a sonar lo cargado"""
+        if self.stream is not None:
+            self.stream.on_first_audio = on_first_audio
+            self.stream.start()
+            return
+        
+        if self.start_at > 0:
+            try:
+                pygame.mixer.music.play(start=self.start_at)
+            except pygame.error:
+                pygame.mixer.music.play()
+                try:
+                    pygame.mixer.music.set_pos(self.start_at)
+                except pygame.error:
+                    pass
+        else:
+            pygame.mixer.music.play()
+        
+        if on_first_audio is not None:
+            on_first_audio()
+    
+    def pause(self):
+        if self.stream is not None:
+            self.stream.pause()
+        else:
+            pygame.mixer.music.pause()
+    
+    def unpause(self):
+        if self.stream is not None:
+            self.stream.resume()
+        else:
+            pygame.mixer.music.unpause()
+    
+    def stop(self):
+        if self.stream is not None:
+            self.stream.stop()
+            self.stream = None
+        pygame.mixer.music.stop()
+    
+    def get_busy(self):
+        if self.stream is not None:
+            return not self.stream.finished.is_set()
+        return pygame.mixer.music.get_busy()
+
+class TrackPrefetcher:
+    """Precarga en la caché de páginas las próximas canciones"""
+    
+    def __init__(self, bandwidth=8 * 1024 * 1024, chunk_size=256 * 1024, max_warm=32):
+        self.bandwidth = bandwidth
+        self.chunk_size = chunk_size
+        self.max_warm = max_warm
+        
+        # Próximas canciones en orden de reproducción y las ya precargadas
+        self.wanted = []
+        self.warm = OrderedDict()
+        self.wakeup = threading.Event()
+        
+        # Tiempo hasta el primer audio por tipo de arranque: [arranques, total, peor]
+        self.starts = {'fría': [0, 0.0, 0.0], 'precargada': [0, 0.0, 0.0]}
+        
+        self.worker = threading.Thread(target=self.run, daemon=True)
+        self.worker.start()
+    
+    def request(self, rutas):
+        """Fija las próximas canciones (reemplaza la petición anterior)"""
+        self.wanted = list(dict.fromkeys(rutas))
+        self.wakeup.set()
+    
+    def is_warm(self, ruta):
+        """Indica si la canción ya se leyó por adelantado"""
+        return self.warm.get(ruta, False)
+    
+    def run(self):
+        """Precarga las canciones pedidas, de una en una y en orden"""
+        while True:
+            self.wakeup.wait()
+            self.wakeup.clear()
+            
+            while True:
+                ruta = next((r for r in self.wanted if r not in self.warm), None)
+                if ruta is None:
+                    break
+                
+                try:
+                    start = time.time()
+                    size = self.prefetch(ruta)
+                    if size is None:
+                        # La petición cambió a mitad de lectura
+                        continue
+                    self.warm[ruta] = True
+                    print(f"✓ Precargada {os.path.basename(ruta)}: "
+                          f"{size / 1048576:.1f} MB en {time.time() - start:.2f}s")
+                except OSError as e:
+                    self.warm[ruta] = False
+                    print(f"⚠ No se pudo precargar {ruta}: {e}")
+                
+                while len(self.warm) > self.max_warm:
+                    self.warm.popitem(last=False)
+    
+    def prefetch(self, ruta):
+        """Lee el archivo por bloques con el ancho de banda limitado"""
+        buffer = bytearray(self.chunk_size)
+        total = 0
+        start = time.monotonic()
+        
+        with open(ruta, 'rb', buffering=0) as f:
+            fd = f.fileno()
+            while True:
+                if ruta not in self.wanted:
+                    return None
+                
+                # Aviso al kernel bloque a bloque: con un solo WILLNEED del archivo
+                # entero la lectura anticipada no respetaría el límite
+                if hasattr(os, 'posix_fadvise'):
+                    os.posix_fadvise(fd, total, self.chunk_size, os.POSIX_FADV_WILLNEED)
+                
+                # La lectura real garantiza la precarga en montajes de red o FUSE,
+                # que suelen ignorar el aviso
+                read = f.readinto(buffer)
+                if not read:
+                    return total
+                total += read
+                
+                # Límite de ancho de banda: no competir con la reproducción
+                delay = total / self.bandwidth - (time.monotonic() - start)
+                if delay > 0:
+                    time.sleep(delay)
+    
+    def record(self, ruta, warm, elapsed):
+        """Registra el tiempo hasta el primer audio de un arranque"""
+        kind = 'precargada' if warm else 'fría'
+        stats = self.starts[kind]
+        stats[0] += 1
+        stats[1] += elapsed
+        stats[2] = max(stats[2], elapsed)
+        print(f"✓ Primer audio en {elapsed * 1000:.0f} ms ({kind}): {os.path.basename(ruta)}")
+    
+    def report(self):
+        """Resumen del tiempo hasta el primer audio"""
+        parts = []
+        for kind, (count, total, worst) in self.starts.items():
+            if count:
+                parts.append(f"{kind} {total / count * 1000:.0f} ms de media "
+                             f"(peor {worst * 1000:.0f} ms, {count} arranques)")
+        return "Primer audio: " + ("; ".join(parts) if parts else "sin arranques")
+
+class CrossfadeEngine:
+    """Fundido cruzado entre dos canciones en dos canales del mixer"""
+    
+    def __init__(self, decoder, output, channels, seconds=0.0, lead_time=6.0, block_seconds=0.5):
+        self.decoder = decoder
+        self.output = output
+        self.channels = channels
+        self.seconds = seconds
+        self.lead_time = lead_time
+        self.block_frames = int(decoder.sample_rate * block_seconds)
+        
+        self.lock = threading.Lock()
+        self.streams = []
+        self.in_ruta = None
+        self.next_index = None
+        self.prepared_for = None
+        self.active = False
+    
+    @property
+    def is_prepared(self):
+        """Hay una transición decodificada esperando"""
+        return bool(self.streams) and not self.active
+    
+    def prepare(self, key, out_ruta, out_start, in_ruta, next_index):
+        """Empieza a decodificar el final de una canción y el inicio de la siguiente"""
+        self.cancel()
+        
+        if not (self.decoder.can_stream(out_ruta) and self.decoder.can_stream(in_ruta)):
+            # Sin decodificador en streaming: cambio de canción normal
+            self.prepared_for = key
+            return
+        
+        fade_frames = max(1, int(self.seconds * self.decoder.sample_rate))
+        self.streams = [
+            ChannelStream(
+                self.channels[0],
+                self.decoder.blocks(out_ruta, self.block_frames, start=out_start, duration=self.seconds),
+                gain=self.ramp(fade_frames, fade_in=False),
+                process=self.output.create_process(self.block_frames)
+            ),
+            ChannelStream(
+                self.channels[1],
+                self.decoder.blocks(in_ruta, self.block_frames, duration=self.seconds),
+                gain=self.ramp(fade_frames, fade_in=True),
+                process=self.output.create_process(self.block_frames)
+            ),
+        ]
+        self.in_ruta = in_ruta
+        self.next_index = next_index
+        self.prepared_for = key
+    
+    def ramp(self, fade_frames, fade_in):
+        """Rampa de ganancia de potencia constante"""
+        def gain(offset, frames):
+            t = np.clip((offset + np.arange(frames)) / fade_frames, 0.0, 1.0)
+            return np.sin(t * np.pi / 2) if fade_in else np.cos(t * np.pi / 2)
+        return gain
+    
+    def start(self):
+        """Arranca el fundido (la música saliente pasa al canal)"""
+        self.output.stop()
+        self.active = True
+        for stream in self.streams:
+            stream.start()
+        
+        threading.Thread(target=self.hand_off, args=(self.streams[1], self.in_ruta), daemon=True).start()
+    
+    def hand_off(self, stream, ruta):
+        """Pasa la canción entrante a la salida principal al acabar el fundido"""
+        try:
+            with self.lock:
+                if stream.stopped:
+                    return
+                self.output.load(ruta, start=self.seconds)
+            
+            stream.finished.wait()
+            
+            with self.lock:
+                if stream.stopped:
+                    return
+                self.output.play()
+                self.active = False
+                self.streams = []
+                self.prepared_for = None
+                
+        except Exception as e:
+            print(f"✗ Error en crossfade: {e}")
+    
+    def pause(self):
+        for stream in self.streams:
+            stream.pause()
+    
+    def resume(self):
+        for stream in self.streams:
+            stream.resume()
+    
+    def cancel(self):
+        """Detiene y descarta la transición"""
+        with self.lock:
+            for stream in self.streams:
+                stream.stop()
+            self.streams = []
+            self.active = False
+            self.in_ruta = None
+            self.next_index = None
+            self.prepared_for = None
+
+class SessionJournal:
+    """Diario de sesión: dos registros binarios de tamaño fijo que se alternan"""
+    
+    MAGIC = b'CDMJ'
+    VERSION = 1
+    RECORD = struct.Struct('<4sHHIIIdddBBB5x64s768s')
+    CHECKSUM = struct.Struct('<I')
+    NO_TRACK = 0xFFFFFFFF
+    
+    def __init__(self):
+        self.path = os.path.join(os.path.expanduser("~"), ".cardamomo_session.bin")
+        self.fd = None
+        self.sequence = 0
+        self.last_state = None
+    
+    @property
+    def slot_size(self):
+        return self.RECORD.size + self.CHECKSUM.size
+    
+    def read(self):
+        """Último estado guardado (o None si no hay o está dañado)"""
+        try:
+            with open(self.path, 'rb') as f:
+                data = f.read(2 * self.slot_size)
+        except OSError:
+            return None
+        
+        # Una escritura cortada solo daña su ranura: gana la válida más reciente
+        latest = None
+        for offset in (0, self.slot_size):
+            record = self.read_slot(data, offset)
+            if record is not None and (latest is None or
+                                       (record[3] - latest[3]) & 0xFFFFFFFF < 0x80000000):
+                latest = record
+        if latest is None:
+            return None
+        
+        (_, _, _, sequence, track_id, index, position, duration, timestamp,
+         shuffle, repeat, paused, playlist, ruta) = latest
+        
+        self.sequence = sequence
+        return {
+            'track_id': track_id,
+            'index': index,
+            'position': position,
+            'duration': duration,
+            'timestamp': timestamp,
+            'shuffle': bool(shuffle),
+            'repeat': bool(repeat),
+            'paused': bool(paused),
+            'playlist': playlist.rstrip(b'\0').decode('utf-8', 'ignore'),
+            'ruta': ruta.rstrip(b'\0').decode('utf-8', 'ignore'),
+        }
+    
+    def read_slot(self, data, offset):
+        """Campos de una ranura (None si está vacía o dañada)"""
+        if len(data) < offset + self.slot_size:
+            return None
+        payload = data[offset:offset + self.RECORD.size]
+        checksum, = self.CHECKSUM.unpack_from(data, offset + self.RECORD.size)
+        if zlib.crc32(payload) != checksum:
+            return None
+        
+        record = self.RECORD.unpack(payload)
+        if record[0] != self.MAGIC or record[1] != self.VERSION:
+            return None
+        return record
+    
+    def write(self, ruta, track_id, index, playlist, position, duration, shuffle, repeat, paused):
+        """Escribe el estado en la ranura más antigua (sin truncar el archivo)"""
+        state = (ruta, track_id, index, playlist, round(position, 1), shuffle, repeat, paused)
+        if state == self.last_state:
+            return
+        
+        path_bytes = ruta.encode('utf-8') if ruta else b''
+        if len(path_bytes) > 768:
+            path_bytes = b''  # Ruta demasiado larga: resume_session la recupera por ID
+        
+        self.sequence = (self.sequence + 1) & 0xFFFFFFFF
+        payload = self.RECORD.pack(
+            self.MAGIC, self.VERSION, 0, self.sequence, track_id, index,
+            position, duration, time.time(), shuffle, repeat, paused,
+            playlist.encode('utf-8')[:64], path_bytes
+        )
+        
+        try:
+            if self.fd is None:
+                self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            # Ranuras alternas: la última copia válida nunca se sobrescribe
+            offset = (self.sequence % 2) * self.slot_size
+            os.pwrite(self.fd, payload + self.CHECKSUM.pack(zlib.crc32(payload)), offset)
+            self.last_state = state
+        except OSError as e:
+            print(f"✗ Error guardando sesión: {e}")
+    
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+class BackgroundAnalyzer(ABC):
+    """Análisis por canción en segundo plano con caché en disco"""
+    
+    kind = "analysis"
+    max_results = 64
+    
+    def __init__(self, decoder):
+        self.decoder = decoder
+        self.cache_dir = os.path.join(os.path.expanduser("~"), ".cardamomo_cache", self.kind)
+        
+        self.results = OrderedDict()
+        self.jobs = queue.Queue()
+        
+        # Solo importa la última canción pedida (la que suena): los trabajos
+        # anteriores se descartan y un análisis en curso se interrumpe
+        self.latest = None
+        self.aborted = False
+        
+        self.worker = threading.Thread(target=self.run, daemon=True)
+        self.worker.start()
+    
+    def get(self, ruta):
+        """Resultado ya calculado (o None)"""
+        return self.results.get(ruta)
+    
+    def request(self, ruta):
+        """Pide el análisis de una canción"""
+        self.latest = ruta
+        if ruta in self.results or not self.decoder.can_stream(ruta):
+            return
+        self.jobs.put(ruta)
+    
+    def run(self):
+        """Atiende las peticiones de análisis"""
+        while True:
+            ruta = self.jobs.get()
+            if ruta != self.latest or ruta in self.results:
+                # Canción ya saltada (o repetida en la cola): no se decodifica
+                continue
+            
+            try:
+                path = self.cache_path(ruta)
+                try:
+                    result = self.load_result(path)
+                    if self.is_empty(result):
+                        # Resultado vacío guardado por versiones anteriores
+                        raise ValueError(path)
+                except (OSError, ValueError, KeyError):
+                    start = time.time()
+                    self.aborted = False
+                    result = self.analyze(ruta)
+                    if self.aborted:
+                        # Se pidió otra canción a mitad del análisis: nada se guarda
+                        continue
+                    if self.is_empty(result):
+                        # Decodificación vacía: no se guarda para reintentar más tarde
+                        print(f"⚠ Análisis '{self.kind}' de {os.path.basename(ruta)} vacío")
+                        continue
+                    os.makedirs(self.cache_dir, exist_ok=True)
+                    self.save_result(path, result)
+                    print(f"✓ Análisis '{self.kind}' de {os.path.basename(ruta)} en {time.time() - start:.2f}s")
+                
+                self.results[ruta] = result
+                while len(self.results) > self.max_results:
+                    self.results.popitem(last=False)
+                
+            except Exception as e:
+                print(f"✗ Error analizando {ruta}: {e}")
+    
+    def blocks(self, ruta, block_frames):
+        """Bloques decodificados; se corta si deja de ser la canción pedida"""
+        blocks = self.decoder.blocks(ruta, block_frames=block_frames)
+        try:
+            for block in blocks:
+                if ruta != self.latest:
+                    self.aborted = True
+                    return
+                yield block
+        finally:
+            blocks.close()
+    
+    def cache_path(self, ruta):
+        """Archivo de caché ligado a la ruta, tamaño y fecha del archivo"""
+        st = os.stat(ruta)
+        key = hashlib.sha1(f"{ruta}|{st.st_size}|{st.st_mtime_ns}".encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, key + ".npz")
+    
+    @abstractmethod
+    def analyze(self, ruta):
+        """Calcula el resultado de una canción (en el hilo de trabajo)"""
+    
+    @abstractmethod
+    def is_empty(self, result):
+        """Indica si el resultado viene de una decodificación vacía"""
+    
+    @abstractmethod
+    def load_result(self, path):
+        """Lee un resultado guardado en la caché de disco"""
+    
+    @abstractmethod
+    def save_result(self, path, result):
+        """Guarda un resultado en la caché de disco"""
+
+class BeatAnalyzer(BackgroundAnalyzer):
+    """Detección de onsets y tempo (flujo espectral)"""
+    
+    kind = "beats"
+    
+    def __init__(self, decoder, n_fft=2048, hop=512):
+        self.n_fft = n_fft
+        self.hop = hop
+        self.window = np.hanning(n_fft).astype(np.float32)
+        super().__init__(decoder)
+    
+    def analyze(self, ruta):
+        """Devuelve (instantes de beat en segundos, BPM)"""
+        envelope = self.onset_envelope(ruta)
+        fps = self.decoder.sample_rate / self.hop
+        
+        bpm, period = self.estimate_tempo(envelope, fps)
+        if period <= 0:
+            return np.zeros(0, dtype=np.float32), 0.0
+        
+        # Ajuste fino de periodo y fase: la rejilla que más energía de onsets acumula
+        periods = period * (1 + np.linspace(-0.01, 0.01, 21))
+        phases = np.arange(int(np.ceil(period)))
+        beats_count = int((len(envelope) - periods.max()) / periods.max())
+        grid = np.arange(beats_count)[None, :] * periods[:, None]
+        indices = np.rint(phases[None, :, None] + grid[:, None, :]).astype(int)
+        scores = envelope[indices].sum(axis=2)
+        best_period, best_phase = np.unravel_index(int(np.argmax(scores)), scores.shape)
+        period = float(periods[best_period])
+        phase = phases[best_phase]
+        bpm = fps * 60 / period
+        
+        # Cada trama se fecha en el centro de su ventana
+        frames = phase + np.arange(0, (len(envelope) - phase) / period) * period
+        beats = (frames * self.hop + self.n_fft / 2) / self.decoder.sample_rate
+        return beats.astype(np.float32), bpm
+    
+    def onset_envelope(self, ruta):
+        """Flujo espectral por bloques, vectorizado por tramas"""
+        chunks = []
+        leftover = np.zeros(0, dtype=np.float32)
+        previous = None
+        
+        for block in self.blocks(ruta, self.hop * 256):
+            samples = np.concatenate((leftover, block.mean(axis=1)))
+            n_frames = (len(samples) - self.n_fft) // self.hop + 1
+            if n_frames <= 0:
+                leftover = samples
+                continue
+            
+            frames = np.lib.stride_tricks.sliding_window_view(samples, self.n_fft)[::self.hop][:n_frames]
+            spectrum = np.log1p(100.0 * np.abs(np.fft.rfft(frames * self.window, axis=1)))
+            
+            # El estado entre bloques es la última trama del bloque anterior
+            if previous is None:
+                previous = spectrum[:1]
+            diff = np.diff(np.vstack((previous, spectrum)), axis=0)
+            chunks.append(np.maximum(diff, 0).sum(axis=1))
+            
+            previous = spectrum[-1:]
+            leftover = samples[n_frames * self.hop:]
+        
+        if not chunks:
+            return np.zeros(0, dtype=np.float32)
+        
+        envelope = np.concatenate(chunks)
+        # Quitar la tendencia lenta (media móvil) y normalizar
+        kernel = np.ones(16) / 16
+        envelope = np.maximum(envelope - np.convolve(envelope, kernel, mode='same'), 0)
+        peak = envelope.max()
+        return (envelope / peak if peak > 0 else envelope).astype(np.float32)
+    
+    def estimate_tempo(self, envelope, fps, min_bpm=60, max_bpm=200):
+        """Tempo por autocorrelación de la envolvente de onsets"""
+        min_lag = int(fps * 60 / max_bpm)
+        max_lag = int(fps * 60 / min_bpm)
+        if len(envelope) < 2 * max_lag:
+            return 0.0, 0.0
+        
+        centered = envelope - envelope.mean()
+        spectrum = np.fft.rfft(centered, n=2 * len(centered))
+        autocorr = np.fft.irfft(np.abs(spectrum) ** 2)[:max_lag + 2]
+        
+        # Preferencia suave por tempos cercanos a 120 BPM (evita errores de octava)
+        lags = np.arange(min_lag, max_lag + 1)
+        weight = np.exp(-0.5 * (np.log2(fps * 60 / lags / 120.0) / 0.9) ** 2)
+        best = min_lag + int(np.argmax(autocorr[min_lag:max_lag + 1] * weight))
+        
+        # Interpolación parabólica del máximo
+        a, b, c = autocorr[best - 1], autocorr[best], autocorr[best + 1]
+        denom = a - 2 * b + c
+        period = best + (0.5 * (a - c) / denom if denom != 0 else 0.0)
+        
+        return float(fps * 60 / period), float(period)
+    
+    def is_empty(self, result):
+        return len(result[0]) == 0
+    
+    def load_result(self, path):
+        with np.load(path) as data:
+            return data['beats'], float(data['bpm'])
+    
+    def save_result(self, path, result):
+        beats, bpm = result
+        np.savez(path, beats=beats, bpm=np.float32(bpm))
+
+class WaveformAnalyzer(BackgroundAnalyzer):
+    """Resumen de forma de onda (picos mín/máx) para la barra de progreso"""
+    
+    kind = "waveform"
+    
+    def __init__(self, decoder, points=2048, hop=512):
+        self.points = points
+        self.hop = hop
+        super().__init__(decoder)
+    
+    def analyze(self, ruta):
+        """Devuelve un array (2, puntos) con los picos mínimo y máximo"""
+        mins = []
+        maxs = []
+        leftover = np.zeros(0, dtype=np.float32)
+        
+        # Una sola pasada: cada bloque se reduce a picos y se descarta
+        for block in self.blocks(ruta, self.hop * 256):
+            samples = np.concatenate((leftover, block.mean(axis=1)))
+            usable = len(samples) // self.hop * self.hop
+            frames = samples[:usable].reshape(-1, self.hop)
+            mins.append(frames.min(axis=1))
+            maxs.append(frames.max(axis=1))
+            leftover = samples[usable:]
+        
+        if leftover.size:
+            mins.append(leftover.min(keepdims=True))
+            maxs.append(leftover.max(keepdims=True))
+        if not mins:
+            return np.zeros((2, 0), dtype=np.float32)
+        
+        return self.resample(np.concatenate(mins), np.concatenate(maxs), self.points)
+    
+    def resample(self, mins, maxs, points):
+        """Reduce los picos a 'points' columnas conservando mín/máx"""
+        if len(mins) <= points:
+            return np.vstack((mins, maxs)).astype(np.float32)
+        
+        edges = np.linspace(0, len(mins), points + 1).astype(int)[:-1]
+        return np.vstack((
+            np.minimum.reduceat(mins, edges),
+            np.maximum.reduceat(maxs, edges)
+        )).astype(np.float32)
+    
+    def is_empty(self, result):
+        return result.shape[1] == 0
+    
+    def load_result(self, path):
+        with np.load(path) as data:
+            return data['peaks'].astype(np.float32) / 127.0
+    
+    def save_result(self, path, result):
+        peaks = np.clip(np.round(result * 127.0), -127, 127).astype(np.int8)
+        np.savez(path, peaks=peaks)
+
 class AudioTracker:
     """Sistema de seguimiento de tiempo de audio"""
     
@@ -243,6 +1410,11 @@ class AudioTracker:
             return 0
         return (self.get_position() / self.total_duration) * 100
 
+def ppm_data(rgb):
+    """Convierte un buffer RGB (alto, ancho, 3) de NumPy a datos PPM para Tk"""
+    height, width = rgb.shape[:2]
+    return f"P6 {width} {height} 255 ".encode('ascii') + np.ascontiguousarray(rgb, dtype=np.uint8).tobytes()
+
 class CavaVisualizer(ctk.CTkFrame):
     """Visualizador estilo cava moderno"""
     
@@ -282,11 +1454,23 @@ class CavaVisualizer(ctk.CTkFrame):
             )
             self.bars.append(bar)
         
+        # Modo cascada (espectrograma): la imagen es el buffer circular
+        self.mode = "bars"
+        self.waterfall_size = None
+        self.ring_index = 0
+        self.row_bands = None
+        self.lut_hex = None
+        self.photo = None
+        self.image_items = []
+        
         # Centrar el visualizador
         self.canvas.bind("<Configure>", self.center_visualizer)
     
     def center_visualizer(self, event=None):
         """Centra las barras en el canvas"""
+        if self.mode == "waterfall":
+            self.reset_waterfall()
+        
         canvas_width = self.canvas.winfo_width()
         if canvas_width > 10:  # Evitar divisiones por cero
             offset = (canvas_width - self.total_width) // 2
@@ -297,8 +1481,91 @@ class CavaVisualizer(ctk.CTkFrame):
                 if coords:
                     self.canvas.coords(bar, x1, coords[1], x2, coords[3])
     
+    def set_mode(self, mode):
+        """Cambia entre barras y cascada"""
+        self.mode = mode
+        
+        state = "normal" if mode == "bars" else "hidden"
+        for bar in self.bars:
+            self.canvas.itemconfigure(bar, state=state)
+        
+        if mode == "waterfall":
+            self.reset_waterfall()
+        else:
+            for item in self.image_items:
+                self.canvas.delete(item)
+            self.image_items = []
+            self.photo = None
+            self.waterfall_size = None
+    
+    def build_lut(self, colors):
+        """Tabla de 256 colores a partir del gradiente de las barras"""
+        gradient = np.array([[int(c[i:i + 2], 16) for i in (1, 3, 5)] for c in colors], dtype=np.float64)
+        positions = np.linspace(0, len(colors) - 1, 256)
+        rgb = np.stack([np.interp(positions, np.arange(len(colors)), gradient[:, k]) for k in range(3)], axis=1)
+        
+        # La intensidad también oscurece el color (silencio = fondo)
+        brightness = (np.arange(256) / 255.0) ** 0.8
+        background = np.array([0x0a, 0x0a, 0x14])
+        lut = (background + (rgb - background) * brightness[:, None]).astype(np.uint8)
+        self.lut_hex = [f"#{r:02x}{g:02x}{b:02x}" for r, g, b in lut]
+    
+    def reset_waterfall(self):
+        """Crea la imagen al tamaño del canvas"""
+        width = self.canvas.winfo_width()
+        height = self.canvas.winfo_height()
+        if width < 10 or height < 10:
+            return
+        if self.waterfall_size == (height, width):
+            return
+        
+        self.waterfall_size = (height, width)
+        self.ring_index = width - 1
+        
+        # Graves abajo, agudos arriba
+        self.row_bands = ((height - 1 - np.arange(height)) * self.num_bars // height).clip(0, self.num_bars - 1)
+        
+        self.photo = tk.PhotoImage(master=self.canvas, width=width, height=height)
+        self.photo.put("#0a0a14", to=(0, 0, width, height))
+        for item in self.image_items:
+            self.canvas.delete(item)
+        
+        # La misma imagen dos veces: el desplazamiento es mover dos items
+        self.image_items = [
+            self.canvas.create_image(0, 0, anchor="nw", image=self.photo),
+            self.canvas.create_image(-width, 0, anchor="nw", image=self.photo)
+        ]
+    
+    def update_waterfall(self, heights, colors):
+        """Añade una columna al espectrograma"""
+        if self.lut_hex is None:
+            self.build_lut(colors)
+        if self.waterfall_size is None:
+            self.reset_waterfall()
+            if self.waterfall_size is None:
+                return
+        
+        width = self.waterfall_size[1]
+        self.ring_index = (self.ring_index + 1) % width
+        ring = self.ring_index
+        
+        # Colorear la columna nueva con la tabla de colores
+        indices = np.clip(np.asarray(heights) * 255, 0, 255).astype(np.intp)[self.row_bands]
+        
+        # Una sola actualización de la imagen: la columna nueva
+        self.photo.put(" ".join("{%s}" % self.lut_hex[i] for i in indices), to=(ring, 0))
+        
+        # La columna más reciente queda en el borde derecho
+        shift = width - 1 - ring
+        self.canvas.coords(self.image_items[0], shift, 0)
+        self.canvas.coords(self.image_items[1], shift - width, 0)
+    
     def update_bars(self, heights, colors):
         """Actualiza las barras con nuevas alturas y colores"""
+        if self.mode == "waterfall":
+            self.update_waterfall(heights, colors)
+            return
+        
         canvas_height = self.canvas.winfo_height()
         if canvas_height < 10:
             return
@@ -319,90 +1586,994 @@ class CavaVisualizer(ctk.CTkFrame):
                 self.canvas.coords(bar_id, coords[0], y1, coords[2], y2)
                 self.canvas.itemconfig(bar_id, fill=color)
 
+class EqualizerWindow(ctk.CTkToplevel):
+    """Ventana del ecualizador gráfico"""
+    
+    def __init__(self, player, **kwargs):
+        super().__init__(player, **kwargs)
+        
+        self.player = player
+        self.title("Ecualizador")
+        self.geometry("480x270")
+        self.resizable(False, False)
+        self.configure(fg_color="#151522")
+        
+        # Activar, presets y guardar
+        top_frame = ctk.CTkFrame(self, fg_color="transparent")
+        top_frame.pack(fill="x", padx=15, pady=(12, 5))
+        
+        self.enabled_var = tk.BooleanVar(value=player.equalizer.enabled)
+        ctk.CTkSwitch(
+            top_frame,
+            text="Activado",
+            variable=self.enabled_var,
+            command=self.on_toggle,
+            progress_color="#00cc66"
+        ).pack(side="left")
+        
+        ctk.CTkButton(
+            top_frame,
+            text="Guardar",
+            width=70,
+            fg_color="#252536",
+            hover_color="#353546",
+            command=self.on_save
+        ).pack(side="right")
+        
+        current = player.cache.settings.get('equalizer', {}).get('preset', "Plano")
+        self.preset_var = tk.StringVar(value=current)
+        self.preset_menu = ctk.CTkOptionMenu(
+            top_frame,
+            values=list(player.equalizer_presets()),
+            variable=self.preset_var,
+            command=self.on_preset,
+            width=130,
+            fg_color="#252536",
+            button_color="#252536"
+        )
+        self.preset_menu.pack(side="right", padx=8)
+        
+        # Bandas
+        bands_frame = ctk.CTkFrame(self, fg_color="transparent")
+        bands_frame.pack(fill="both", expand=True, padx=10, pady=5)
+        
+        self.sliders = []
+        self.value_labels = []
+        for band, freq in enumerate(Equalizer.FREQUENCIES):
+            column = ctk.CTkFrame(bands_frame, fg_color="transparent")
+            column.pack(side="left", expand=True, fill="y")
+            
+            value_label = ctk.CTkLabel(column, text="", font=("Arial", 9), text_color="#8888aa")
+            value_label.pack()
+            
+            slider = ctk.CTkSlider(
+                column,
+                orientation="vertical",
+                from_=-12,
+                to=12,
+                number_of_steps=48,
+                height=150,
+                width=16,
+                progress_color="#00cc66",
+                button_color="#00ff88",
+                button_hover_color="#33ffaa",
+                command=lambda value, band=band: self.on_slider(band, value)
+            )
+            slider.pack(pady=2)
+            
+            label = f"{freq // 1000}k" if freq >= 1000 else str(freq)
+            ctk.CTkLabel(column, text=label, font=("Arial", 9), text_color="#e0e0ff").pack()
+            
+            self.sliders.append(slider)
+            self.value_labels.append(value_label)
+        
+        self.refresh()
+    
+    def refresh(self):
+        """Sincroniza los sliders con el ecualizador"""
+        for slider, label, gain in zip(self.sliders, self.value_labels, self.player.equalizer.gains):
+            slider.set(gain)
+            label.configure(text=f"{gain:+.0f}")
+    
+    def on_toggle(self):
+        self.player.set_equalizer_enabled(self.enabled_var.get())
+    
+    def on_slider(self, band, value):
+        self.player.set_equalizer_gain(band, value)
+        self.value_labels[band].configure(text=f"{value:+.0f}")
+    
+    def on_preset(self, name):
+        self.player.apply_equalizer_preset(name)
+        self.refresh()
+    
+    def on_save(self):
+        dialog = ctk.CTkInputDialog(text="Nombre del preset:", title="Guardar preset")
+        name = (dialog.get_input() or "").strip()
+        if not name:
+            return
+        
+        self.player.save_equalizer_preset(name)
+        self.preset_menu.configure(values=list(self.player.equalizer_presets()))
+        self.preset_var.set(name)
+
+class TrackRow:
+    """Vista ligera de una canción de la tabla (acceso tipo dict)"""
+    
+    __slots__ = ('table', 'track_id')
+    
+    def __init__(self, table, track_id):
+        self.table = table
+        self.track_id = track_id
+    
+    def __getitem__(self, key):
+        table = self.table
+        track_id = self.track_id
+        if key == 'ruta':
+            return table.path(track_id)
+        if key == 'nombre':
+            return table.names[track_id]
+        if key == 'duracion':
+            return table.durations[track_id]
+        if key == 'agregada':
+            return table.added[track_id]
+        raise KeyError(key)
+    
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+    
+    def __eq__(self, other):
+        return (isinstance(other, TrackRow) and other.table is self.table
+                and other.track_id == self.track_id)
+    
+    def __hash__(self):
+        return hash(self.track_id)
+
+class TrackTable:
+    """Tabla de canciones en columnas (carpetas internadas + arrays)"""
+    
+    def __init__(self):
+        # Carpetas únicas: cada canción guarda solo el ID de su carpeta
+        self.dirs = []
+        self.dir_index = {}
+        
+        self.dir_ids = array('I')
+        self.names = []
+        self.durations = array('d')
+        self.added = array('d')
+        
+        # Búsqueda por nombre de archivo (reutiliza las cadenas de 'names')
+        self.name_index = {}
+    
+    def __len__(self):
+        return len(self.names)
+    
+    def __getitem__(self, track_id):
+        if not 0 <= track_id < len(self.names):
+            raise IndexError(track_id)
+        return TrackRow(self, track_id)
+    
+    def path(self, track_id):
+        """Ruta completa de una canción"""
+        return os.path.join(self.dirs[self.dir_ids[track_id]], self.names[track_id])
+    
+    def append(self, ruta, duracion, agregada):
+        """Agrega una canción y devuelve su ID"""
+        folder, name = os.path.split(ruta)
+        
+        dir_id = self.dir_index.get(folder)
+        if dir_id is None:
+            dir_id = self.dir_index[folder] = len(self.dirs)
+            self.dirs.append(sys.intern(folder))
+        
+        track_id = len(self.names)
+        self.dir_ids.append(dir_id)
+        self.names.append(name)
+        self.durations.append(duracion)
+        self.added.append(agregada)
+        
+        # Un solo ID por nombre; varios solo si el nombre se repite en otra carpeta
+        previous = self.name_index.get(name)
+        if previous is None:
+            self.name_index[name] = track_id
+        elif isinstance(previous, list):
+            previous.append(track_id)
+        else:
+            self.name_index[name] = [previous, track_id]
+        
+        return track_id
+    
+    def find(self, ruta):
+        """ID de una ruta (o None)"""
+        folder, name = os.path.split(ruta)
+        dir_id = self.dir_index.get(folder)
+        candidates = self.name_index.get(name)
+        if dir_id is None or candidates is None:
+            return None
+        
+        if not isinstance(candidates, list):
+            candidates = (candidates,)
+        for track_id in candidates:
+            if self.dir_ids[track_id] == dir_id:
+                return track_id
+        return None
+    
+    def to_json(self):
+        """Columnas serializables"""
+        # 'added' es la última columna que crece en append(): con esa longitud
+        # todas las columnas son coherentes aunque otro hilo esté agregando
+        count = len(self.added)
+        return {
+            'dirs': self.dirs[:],
+            'dir_ids': self.dir_ids[:count].tolist(),
+            'names': self.names[:count],
+            'durations': self.durations[:count].tolist(),
+            'added': self.added[:count].tolist()
+        }
+    
+    @classmethod
+    def from_json(cls, data):
+        """Reconstruye la tabla desde sus columnas"""
+        table = cls()
+        table.dirs = [sys.intern(folder) for folder in data['dirs']]
+        table.dir_index = {folder: i for i, folder in enumerate(table.dirs)}
+        table.dir_ids = array('I', data['dir_ids'])
+        table.names = data['names']
+        table.durations = array('d', data['durations'])
+        table.added = array('d', data['added'])
+        
+        if not (len(table.dir_ids) == len(table.names) == len(table.durations) == len(table.added)):
+            raise ValueError("Columnas de la tabla de canciones desiguales")
+        
+        for track_id, name in enumerate(table.names):
+            previous = table.name_index.get(name)
+            if previous is None:
+                table.name_index[name] = track_id
+            elif isinstance(previous, list):
+                previous.append(track_id)
+            else:
+                table.name_index[name] = [previous, track_id]
+        
+        return table
+    
+    @classmethod
+    def from_rows(cls, rows):
+        """Tabla desde el formato antiguo (un dict por canción)"""
+        table = cls()
+        for song in rows:
+            table.append(song['ruta'], song.get('duracion', 180.0), song.get('agregada', 0.0))
+        return table
+    
+    def memory_usage(self):
+        """Bytes aproximados que ocupa la tabla"""
+        total = sum(sys.getsizeof(column) for column in (
+            self.dirs, self.dir_index, self.dir_ids, self.names,
+            self.durations, self.added, self.name_index
+        ))
+        total += sum(sys.getsizeof(folder) for folder in self.dirs)
+        total += sum(sys.getsizeof(name) for name in self.names)
+        total += sum(sys.getsizeof(ids) for ids in self.name_index.values() if isinstance(ids, list))
+        return total
+
+class PlaylistSnapshot:
+    """Versión inmutable de la playlist activa sobre la tabla de canciones"""
+    
+    __slots__ = ('tracks', 'name', 'ids', 'members', 'version')
+    
+    def __init__(self, tracks, name, ids, members, version):
+        # Nunca se modifica después de publicarse: los lectores no necesitan lock
+        self.tracks = tracks
+        self.name = name
+        self.ids = ids
+        self.members = members
+        self.version = version
+    
+    def __len__(self):
+        return len(self.ids)
+    
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.tracks[track_id] for track_id in self.ids[index]]
+        return self.tracks[self.ids[index]]
+    
+    def __iter__(self):
+        tracks = self.tracks
+        for track_id in self.ids:
+            yield tracks[track_id]
+
 class PlaylistCache:
-    """Caché persistente de playlist"""
+    """Caché persistente de playlists"""
+    
+    DEFAULT_PLAYLIST = "Principal"
+    
+    def __init__(self):
+        self.cache_file = os.path.join(os.path.expanduser("~"), ".cardamomo_playlist.json")
+        self.playlists_dir = os.path.join(os.path.expanduser("~"), ".cardamomo_playlists")
+        
+        # Tabla compartida de canciones: el ID es la posición en la tabla
+        self.tracks = TrackTable()
+        
+        # Playlists con nombre: solo la activa está cargada (array de IDs)
+        self.playlist_files = {self.DEFAULT_PLAYLIST: self.playlist_filename(self.DEFAULT_PLAYLIST)}
+        
+        # La playlist activa se publica como versiones inmutables (copy-on-write):
+        # los escritores construyen la siguiente bajo write_lock y la cambian de
+        # una sola asignación; los lectores toman self.snapshot sin bloquear
+        self.write_lock = threading.RLock()
+        self.save_lock = threading.Lock()
+        self.snapshot = PlaylistSnapshot(self.tracks, self.DEFAULT_PLAYLIST, array('I'), frozenset(), 0)
+        
+        # Preferencias del reproductor
+        self.settings = {}
+        
+        self.load()
+    
+    @property
+    def playlist(self):
+        """Versión actual de la playlist activa"""
+        return self.snapshot
+    
+    @property
+    def active_name(self):
+        """Nombre de la playlist activa"""
+        return self.snapshot.name
+    
+    @property
+    def track_ids(self):
+        """IDs de la playlist activa (no modificar)"""
+        return self.snapshot.ids
+    
+    @property
+    def active_ids(self):
+        """Conjunto de IDs de la playlist activa"""
+        return self.snapshot.members
+    
+    @property
+    def playlist_names(self):
+        """Nombres de las playlists guardadas"""
+        return list(self.playlist_files)
+    
+    def playlist_filename(self, name):
+        """Nombre del archivo de IDs de una playlist"""
+        return hashlib.sha1(name.encode('utf-8')).hexdigest()[:16] + ".ids"
+    
+    def load(self):
+        """Carga la tabla de canciones y la playlist activa"""
+        try:
+            if os.path.exists(self.cache_file):
+                with open(self.cache_file, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                
+                self.settings = data.get('settings', {})
+                
+                if 'tracks' in data:
+                    tracks = data['tracks']
+                    if isinstance(tracks, list):
+                        # Tabla de un dict por canción (versión anterior)
+                        self.tracks = TrackTable.from_rows(tracks)
+                    else:
+                        self.tracks = TrackTable.from_json(tracks)
+                    self.playlist_files = data.get('playlists') or self.playlist_files
+                    name = data.get('active', self.DEFAULT_PLAYLIST)
+                    if name not in self.playlist_files:
+                        name = next(iter(self.playlist_files))
+                    self.load_playlist(name)
+                else:
+                    # Formato antiguo: una sola playlist con las canciones completas
+                    self.tracks = TrackTable.from_rows(data.get('playlist', []))
+                    self.publish(array('I', range(len(self.tracks))))
+                
+                # Los archivos que ya no existen se filtran después (find_missing)
+                print(f"✓ Playlist '{self.active_name}' cargada: {len(self.track_ids)} canciones")
+                if len(self.tracks):
+                    print(f"  Tabla: {len(self.tracks)} canciones, "
+                          f"~{self.tracks.memory_usage() / len(self.tracks):.0f} bytes por canción")
+            else:
+                print("⚠ No hay playlist guardada")
+                
+        except Exception as e:
+            print(f"✗ Error cargando playlist: {e}")
+            self.tracks = TrackTable()
+            self.publish(array('I'))
+    
+    def load_playlist(self, name):
+        """Carga el array de IDs de una playlist"""
+        ids = array('I')
+        path = os.path.join(self.playlists_dir, self.playlist_files[name])
+        try:
+            with open(path, 'rb') as f:
+                ids.frombytes(f.read())
+        except FileNotFoundError:
+            pass
+        
+        # Descartar IDs que no estén en la tabla (archivo ajeno o corrupto)
+        if any(track_id >= len(self.tracks) for track_id in ids):
+            ids = array('I', (i for i in ids if i < len(self.tracks)))
+        
+        self.publish(ids, name)
+    
+    def publish(self, ids, name=None, members=None):
+        """Publica una nueva versión de la playlist activa"""
+        with self.write_lock:
+            current = self.snapshot
+            if members is None:
+                members = frozenset(ids)
+            # Una sola asignación: los lectores ven la versión anterior o la nueva
+            self.snapshot = PlaylistSnapshot(self.tracks, name or current.name, ids,
+                                             members, current.version + 1)
+            return self.snapshot
+    
+    def save(self):
+        """Guarda la tabla de canciones y la playlist activa"""
+        # Serializa guardados simultáneos (escáner y Tk) sin bloquear a los escritores
+        with self.save_lock:
+            try:
+                snapshot = self.snapshot
+                data = {
+                    'tracks': self.tracks.to_json(),
+                    'playlists': dict(self.playlist_files),
+                    'active': snapshot.name,
+                    'settings': self.settings,
+                    'last_updated': time.time(),
+                    'total_songs': len(self.tracks)
+                }
+                
+                with open(self.cache_file, 'w', encoding='utf-8') as f:
+                    json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+                
+                self.save_playlist(snapshot)
+                
+                print(f"✓ Playlist '{snapshot.name}' guardada: {len(snapshot)} canciones")
+                
+            except Exception as e:
+                print(f"✗ Error guardando playlist: {e}")
+    
+    def save_playlist(self, snapshot=None):
+        """Guarda el array de IDs de la playlist activa"""
+        if snapshot is None:
+            snapshot = self.snapshot
+        os.makedirs(self.playlists_dir, exist_ok=True)
+        path = os.path.join(self.playlists_dir, self.playlist_files[snapshot.name])
+        with open(path, 'wb') as f:
+            f.write(snapshot.ids.tobytes())
+    
+    def switch_playlist(self, name):
+        """Cambia la playlist activa"""
+        with self.write_lock:
+            if name not in self.playlist_files or name == self.active_name:
+                return False
+            
+            self.save_playlist()
+            self.load_playlist(name)
+            return True
+    
+    def create_playlist(self, name):
+        """Crea una playlist vacía y la activa"""
+        with self.write_lock:
+            if not name or name in self.playlist_files:
+                return False
+            
+            self.save_playlist()
+            self.playlist_files[name] = self.playlist_filename(name)
+            self.publish(array('I'), name)
+        self.save()
+        return True
+    
+    def delete_playlist(self, name):
+        """Elimina una playlist (las canciones siguen en la tabla)"""
+        with self.write_lock:
+            if name not in self.playlist_files or len(self.playlist_files) == 1:
+                return False
+            
+            filename = self.playlist_files.pop(name)
+            try:
+                os.remove(os.path.join(self.playlists_dir, filename))
+            except OSError:
+                pass
+            
+            if name == self.active_name:
+                self.load_playlist(next(iter(self.playlist_files)))
+        self.save()
+        return True
+    
+    def song_entry(self, ruta):
+        """Par (ruta, duración), reutilizando la duración de la tabla si ya existe"""
+        track_id = self.tracks.find(ruta)
+        if track_id is not None:
+            return ruta, self.tracks.durations[track_id]
+        return ruta, self.get_duration(ruta)
+    
+    def add_songs(self, entries):
+        """Agrega canciones (ruta, duración) publicando una sola versión nueva"""
+        if not entries:
+            return 0
+        
+        # La base se toma dentro del lock: un clear() concurrente no se deshace
+        with self.write_lock:
+            current = self.snapshot
+            ids = array('I', current.ids)
+            members = set(current.members)
+            agregada = time.time()
+            
+            for ruta, duracion in entries:
+                track_id = self.tracks.find(ruta)
+                if track_id is None:
+                    track_id = self.tracks.append(ruta, duracion, agregada)
+                elif track_id in members:
+                    # Ya existe en la playlist activa
+                    continue
+                ids.append(track_id)
+                members.add(track_id)
+            
+            added = len(ids) - len(current.ids)
+            if added:
+                self.publish(ids, members=frozenset(members))
+            return added
+    
+    def clear(self):
+        """Vacía la playlist activa"""
+        self.publish(array('I'))
+    
+    def find_missing(self):
+        """IDs de la playlist activa cuyo archivo ya no existe"""
+        tracks = self.tracks
+        return {track_id for track_id in self.track_ids if not os.path.exists(tracks.path(track_id))}
+    
+    def remove_ids(self, ids):
+        """Quita canciones de la playlist activa"""
+        with self.write_lock:
+            current = self.snapshot
+            ids = set(ids) & current.members
+            if ids:
+                self.publish(array('I', (i for i in current.ids if i not in ids)))
+            return len(ids)
+    
+    def get_duration(self, ruta):
+        """Obtiene duración de archivo de audio"""
+        try:
+            if ruta.lower().endswith('.mp3'):
+                return MP3(ruta).info.length
+            elif ruta.lower().endswith('.flac'):
+                return FLAC(ruta).info.length
+            elif ruta.lower().endswith('.ogg'):
+                return OggVorbis(ruta).info.length
+            else:
+                audio = File(ruta)
+                if audio and hasattr(audio.info, 'length'):
+                    return audio.info.length
+        except:
+            pass
+        
+        return 180.0
+    
+    def collapse_duplicates(self, groups):
+        """Deja una sola copia de cada grupo de duplicados"""
+        with self.write_lock:
+            current = self.snapshot
+            # Se conserva la primera aparición de cada grupo en la playlist
+            order = {self.tracks.path(track_id): i for i, track_id in enumerate(current.ids)}
+            remove = set()
+            for group in groups:
+                keep = min(group, key=lambda ruta: order.get(ruta, len(order)))
+                remove.update(self.tracks.find(ruta) for ruta in group if ruta != keep)
+            
+            ids = array('I', (i for i in current.ids if i not in remove))
+            self.publish(ids)
+            return len(current.ids) - len(ids)
+
+class PlaylistFile:
+    """Importación y exportación de playlists M3U/M3U8, PLS y XSPF en streaming"""
+    
+    FORMATS = {'.m3u': 'm3u', '.m3u8': 'm3u', '.pls': 'pls', '.xspf': 'xspf'}
+    
+    def __init__(self, extensions, max_dirs=256):
+        self.extensions = extensions
+        self.max_dirs = max_dirs
+        
+        # Nombres de cada carpeta: un solo scandir por carpeta en lugar de un
+        # stat() por canción (acotado para mantener la memoria constante)
+        self.dir_names = OrderedDict()
+    
+    @classmethod
+    def format_of(cls, path):
+        """Formato de playlist según la extensión (o None)"""
+        return cls.FORMATS.get(os.path.splitext(path)[1].lower())
+    
+    def read(self, path):
+        """Rutas de las canciones existentes de la playlist"""
+        # Las duraciones del archivo (#EXTINF, LengthN, <duration>) no se usan:
+        # suelen estar redondeadas y el fin de pista depende de la duración real
+        base = os.path.dirname(os.path.abspath(path))
+        reader = getattr(self, 'read_' + self.format_of(path))
+        
+        for location in reader(path):
+            ruta = self.resolve(location, base)
+            if ruta is not None:
+                yield ruta
+    
+    def resolve(self, location, base):
+        """Ruta absoluta de una entrada (None si no es un archivo de audio existente)"""
+        # M3U y PLS guardan rutas sin codificar; solo las URLs file:// se decodifican
+        if '://' in location:
+            parts = urlsplit(location)
+            if parts.scheme != 'file':
+                # Radios y URLs remotas no se importan
+                return None
+            location = unquote(parts.path)
+        
+        if os.path.splitext(location)[1].lower() not in self.extensions:
+            return None
+        
+        ruta = os.path.normpath(os.path.join(base, os.path.expanduser(location)))
+        if self.exists(ruta):
+            return ruta
+        
+        # Playlists creadas en Windows con rutas relativas
+        if '\\' in location and os.sep == '/':
+            ruta = os.path.normpath(os.path.join(base, location.replace('\\', '/')))
+            if self.exists(ruta):
+                return ruta
+        return None
+    
+    def exists(self, ruta):
+        """Comprueba la existencia con el listado en caché de su carpeta"""
+        folder, name = os.path.split(ruta)
+        names = self.dir_names.get(folder)
+        
+        if names is None:
+            try:
+                with os.scandir(folder) as entries:
+                    names = frozenset(entry.name for entry in entries)
+            except OSError:
+                names = frozenset()
+            self.dir_names[folder] = names
+            if len(self.dir_names) > self.max_dirs:
+                self.dir_names.popitem(last=False)
+        else:
+            self.dir_names.move_to_end(folder)
+        
+        return name in names
+    
+    @staticmethod
+    def decode(raw):
+        """Línea en UTF-8 o, si no lo es, en Latin-1 (M3U antiguos)"""
+        try:
+            line = raw.decode('utf-8')
+        except UnicodeDecodeError:
+            line = raw.decode('latin-1')
+        return line.strip().lstrip('\ufeff')
+    
+    def read_m3u(self, path):
+        """Entradas de un M3U/M3U8 línea a línea"""
+        with open(path, 'rb') as f:
+            for raw in f:
+                line = self.decode(raw)
+                # Las líneas con '#' son comentarios o metadatos (#EXTINF)
+                if line and not line.startswith('#'):
+                    yield line
+    
+    def read_pls(self, path):
+        """Entradas de un PLS (FileN=) sin cargar el archivo entero"""
+        with open(path, 'rb') as f:
+            for raw in f:
+                key, sep, value = self.decode(raw).partition('=')
+                key = key.strip().lower()
+                if sep and key.startswith('file') and key[4:].isdigit() and value.strip():
+                    yield value.strip()
+    
+    def read_xspf(self, path):
+        """Entradas de un XSPF con iterparse (cada pista se libera al leerla)"""
+        track_list = None
+        
+        for event, elem in ET.iterparse(path, events=('start', 'end')):
+            tag = elem.tag.rsplit('}', 1)[-1]
+            if event == 'start':
+                if tag == 'trackList':
+                    track_list = elem
+                continue
+            if tag != 'track':
+                continue
+            
+            location = None
+            for child in elem:
+                if child.tag.rsplit('}', 1)[-1] == 'location' and child.text:
+                    location = child.text.strip()
+                    break
+            
+            if location:
+                # <location> es una URI: también las relativas van codificadas
+                parts = urlsplit(location)
+                if parts.scheme in ('', 'file'):
+                    yield unquote(parts.path)
+            
+            elem.clear()
+            if track_list is not None:
+                track_list.remove(elem)
+    
+    def write(self, path, songs):
+        """Exporta las canciones en el formato de la extensión"""
+        writer = getattr(self, 'write_' + (self.format_of(path) or 'm3u'))
+        
+        # Se escribe a un temporal para no dejar un archivo a medias
+        temp = path + ".tmp"
+        with open(temp, 'w', encoding='utf-8', newline='\n') as f:
+            count = writer(f, songs)
+        os.replace(temp, path)
+        return count
+    
+    @staticmethod
+    def title(song):
+        """Título de la canción (nombre sin extensión)"""
+        return os.path.splitext(song['nombre'])[0]
+    
+    def write_m3u(self, f, songs):
+        f.write("#EXTM3U\n")
+        count = 0
+        for song in songs:
+            f.write(f"#EXTINF:{round(song['duracion'])},{self.title(song)}\n{song['ruta']}\n")
+            count += 1
+        return count
+    
+    def write_pls(self, f, songs):
+        f.write("[playlist]\n")
+        count = 0
+        for count, song in enumerate(songs, 1):
+            f.write(f"File{count}={song['ruta']}\n"
+                    f"Title{count}={self.title(song)}\n"
+                    f"Length{count}={round(song['duracion'])}\n")
+        f.write(f"NumberOfEntries={count}\nVersion=2\n")
+        return count
+    
+    def write_xspf(self, f, songs):
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                '<playlist version="1" xmlns="http://xspf.org/ns/0/">\n'
+                '  <trackList>\n')
+        count = 0
+        for song in songs:
+            f.write(f"    <track><location>{escape('file://' + quote(song['ruta']))}</location>"
+                    f"<title>{escape(self.title(song))}</title>"
+                    f"<duration>{round(song['duracion'] * 1000)}</duration></track>\n")
+            count += 1
+        f.write('  </trackList>\n</playlist>\n')
+        return count
+
+class FolderScanner:
+    """Escaneo progresivo y cancelable de carpetas"""
+    
+    EXTENSIONS = {'.mp3', '.wav', '.ogg', '.flac', '.m4a', '.aac'}
+    
+    def __init__(self, cache, on_progress, on_finished, on_error, batch_interval=0.25):
+        self.cache = cache
+        self.on_progress = on_progress
+        self.on_finished = on_finished
+        self.on_error = on_error
+        self.batch_interval = batch_interval
+        
+        # Cola única de trabajos: las peticiones se fusionan aquí
+        self.jobs = queue.Queue()
+        self.pending = set()
+        self.lock = threading.Lock()
+        self.cancel_event = threading.Event()
+        self.worker = None
+    
+    @property
+    def is_scanning(self):
+        """Indica si hay un escaneo en curso o pendiente"""
+        with self.lock:
+            return bool(self.pending)
+    
+    def request(self, folder):
+        """Encola una carpeta o un archivo (se ignora si ya está cubierto)"""
+        folder = os.path.realpath(folder)
+        
+        with self.lock:
+            for pending in self.pending:
+                if folder == pending or folder.startswith(pending + os.sep):
+                    return False
+            
+            # Cada trabajo lleva el evento de cancelación vigente al pedirlo
+            self.pending.add(folder)
+            self.jobs.put((folder, self.cancel_event))
+            
+            if self.worker is None:
+                self.worker = threading.Thread(target=self.run, daemon=True)
+                self.worker.start()
+        
+        return True
     
-    def __init__(self):
-        self.cache_file = os.path.join(os.path.expanduser("~"), ".cardamomo_playlist.json")
-        self.playlist = []
-        self.load()
+    def cancel(self):
+        """Cancela el escaneo en curso y los pendientes"""
+        with self.lock:
+            # Las peticiones posteriores usan un evento nuevo: el hilo puede
+            # seguir terminando el trabajo cancelado sin descartarlas
+            self.cancel_event.set()
+            self.cancel_event = threading.Event()
+            while not self.jobs.empty():
+                self.jobs.get_nowait()
+            self.pending.clear()
     
-    def load(self):
-        """Carga la playlist desde caché"""
-        try:
-            if os.path.exists(self.cache_file):
-                with open(self.cache_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
+    def run(self):
+        """Procesa la cola de trabajos hasta vaciarla"""
+        new_songs = 0
+        found = 0
+        last_report = time.time()
+        cancelled = False
+        
+        while True:
+            with self.lock:
+                if self.jobs.empty():
+                    self.worker = None
+                    break
+                folder, cancel_event = self.jobs.get_nowait()
+            
+            try:
+                batch = []
+                for filepath in self.entries(folder, cancel_event):
+                    if cancel_event.is_set():
+                        break
                     
-                    # Filtrar archivos que aún existen
-                    self.playlist = []
-                    for song in data.get('playlist', []):
-                        if os.path.exists(song['ruta']):
-                            self.playlist.append(song)
+                    found += 1
+                    batch.append(self.cache.song_entry(filepath))
                     
-                    print(f"✓ Playlist cargada: {len(self.playlist)} canciones válidas")
-            else:
-                print("⚠ No hay playlist guardada")
-                self.playlist = []
+                    # Publicar una versión de la playlist por lote de tiempo
+                    now = time.time()
+                    if now - last_report >= self.batch_interval:
+                        last_report = now
+                        new_songs += self.cache.add_songs(batch)
+                        batch = []
+                        self.on_progress(new_songs, found)
                 
-        except Exception as e:
-            print(f"✗ Error cargando playlist: {e}")
-            self.playlist = []
-    
-    def save(self):
-        """Guarda la playlist en caché"""
-        try:
-            data = {
-                'playlist': self.playlist,
-                'last_updated': time.time(),
-                'total_songs': len(self.playlist)
-            }
-            
-            with open(self.cache_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
-            
-            print(f"✓ Playlist guardada: {len(self.playlist)} canciones")
+                new_songs += self.cache.add_songs(batch)
+                self.cache.save()
+                
+            except Exception as e:
+                self.on_error(str(e))
             
-        except Exception as e:
-            print(f"✗ Error guardando playlist: {e}")
+            # Si se canceló, cancel() ya vació 'pending' (y puede haber una
+            # petición nueva de la misma carpeta que no hay que quitar)
+            cancelled = cancel_event.is_set()
+            with self.lock:
+                if not cancelled:
+                    self.pending.discard(folder)
+        
+        self.on_finished(new_songs, cancelled)
     
-    def add_song(self, ruta):
-        """Agrega una canción si no existe"""
-        # Verificar si ya existe
-        for song in self.playlist:
-            if song['ruta'] == ruta:
-                return False
+    def entries(self, path, cancel_event):
+        """Canciones de una carpeta, un archivo o una playlist"""
+        if PlaylistFile.format_of(path) and os.path.isfile(path):
+            return PlaylistFile(self.EXTENSIONS).read(path)
+        return self.walk(path, cancel_event)
+    
+    def walk(self, folder, cancel_event):
+        """Recorre la carpeta recursivamente con os.scandir"""
+        if os.path.isfile(folder):
+            # Archivo suelto (por ejemplo, abierto desde el gestor de archivos)
+            if os.path.splitext(folder)[1].lower() in self.EXTENSIONS:
+                yield folder
+            return
         
-        # Obtener duración
-        duracion = self.get_duration(ruta)
+        try:
+            with os.scandir(folder) as entries:
+                subfolders = []
+                for entry in entries:
+                    if cancel_event.is_set():
+                        return
+                    
+                    # DirEntry ya trae el tipo: no hace falta stat() extra
+                    if entry.is_dir(follow_symlinks=False):
+                        subfolders.append(entry.path)
+                    elif (os.path.splitext(entry.name)[1].lower() in self.EXTENSIONS
+                          and entry.is_file()):
+                        yield entry.path
+        except OSError:
+            return
         
-        # Agregar nueva canción
-        self.playlist.append({
-            'ruta': ruta,
-            'duracion': duracion,
-            'nombre': os.path.basename(ruta),
-            'agregada': time.time()
-        })
+        for subfolder in subfolders:
+            yield from self.walk(subfolder, cancel_event)
+
+class DuplicateFinder:
+    """Detector de canciones duplicadas por contenido"""
+    
+    def __init__(self, chunk_size=64 * 1024, num_samples=4, max_workers=None):
+        self.chunk_size = chunk_size
+        self.num_samples = num_samples
+        self.max_workers = max_workers or min(8, (os.cpu_count() or 1) * 2)
+        
+        # Estadísticas del último análisis
+        self.bytes_hashed = 0
+        self.files_sampled = 0
+        self.files_fully_hashed = 0
+    
+    def find(self, songs):
+        """Devuelve grupos de rutas con contenido idéntico"""
+        self.bytes_hashed = 0
+        self.files_sampled = 0
+        self.files_fully_hashed = 0
+        
+        # Fase 1: agrupar por tamaño y duración (sin leer los archivos)
+        candidates = {}
+        for song in songs:
+            try:
+                size = os.path.getsize(song['ruta'])
+            except OSError:
+                continue
+            key = (size, round(song.get('duracion', 0), 1))
+            candidates.setdefault(key, []).append(song['ruta'])
+        
+        groups = [rutas for rutas in candidates.values() if len(rutas) > 1]
+        if not groups:
+            return []
+        
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            # Fase 2: hash de fragmentos muestreados, solo entre candidatos
+            groups = self.regroup(executor, groups, self.sample_hash)
+            self.files_sampled = sum(len(group) for group in groups)
+            
+            # Fase 3: hash completo, solo de los que siguen coincidiendo
+            groups = self.regroup(executor, groups, self.full_hash)
+            self.files_fully_hashed = sum(len(group) for group in groups)
         
-        return True
+        return groups
     
-    def get_duration(self, ruta):
-        """Obtiene duración de archivo de audio"""
+    def regroup(self, executor, groups, hash_func):
+        """Subdivide los grupos según el hash dado, en paralelo"""
+        paths = [ruta for group in groups for ruta in group]
+        digests = {}
+        # Los bytes se suman aquí, no en los hilos de trabajo
+        for ruta, (digest, hashed) in zip(paths, executor.map(hash_func, paths)):
+            digests[ruta] = digest
+            self.bytes_hashed += hashed
+        
+        result = []
+        for group in groups:
+            buckets = {}
+            for ruta in group:
+                digest = digests[ruta]
+                if digest is not None:
+                    buckets.setdefault(digest, []).append(ruta)
+            result.extend(bucket for bucket in buckets.values() if len(bucket) > 1)
+        return result
+    
+    def sample_hash(self, ruta):
+        """Hash de algunos fragmentos repartidos por el archivo y bytes leídos"""
+        hashed = 0
         try:
-            if ruta.lower().endswith('.mp3'):
-                return MP3(ruta).info.length
-            elif ruta.lower().endswith('.flac'):
-                return FLAC(ruta).info.length
-            elif ruta.lower().endswith('.ogg'):
-                return OggVorbis(ruta).info.length
-            else:
-                audio = File(ruta)
-                if audio and hasattr(audio.info, 'length'):
-                    return audio.info.length
-        except:
-            pass
-        
-        return 180.0
+            with open(ruta, 'rb') as f:
+                size = os.fstat(f.fileno()).st_size
+                digest = hashlib.blake2b(struct.pack('<Q', size), digest_size=16)
+                if size == 0:
+                    return digest.digest(), hashed
+                
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    last = max(0, size - self.chunk_size)
+                    steps = max(1, self.num_samples - 1)
+                    offsets = sorted({last * i // steps for i in range(self.num_samples)})
+                    for offset in offsets:
+                        chunk = mm[offset:offset + self.chunk_size]
+                        digest.update(chunk)
+                        hashed += len(chunk)
+                return digest.digest(), hashed
+        except (OSError, ValueError):
+            return None, hashed
+    
+    def full_hash(self, ruta):
+        """Hash del contenido completo del archivo y bytes leídos"""
+        try:
+            with open(ruta, 'rb') as f:
+                size = os.fstat(f.fileno()).st_size
+                digest = hashlib.blake2b(digest_size=32)
+                if size == 0:
+                    return digest.digest(), 0
+                
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    block = 1024 * 1024
+                    for offset in range(0, size, block):
+                        digest.update(mm[offset:offset + block])
+                return digest.digest(), size
+        except (OSError, ValueError):
+            return None, 0
 
 class CardamomoPlayer(ctk.CTk):
     def __init__(self):
@@ -417,11 +2588,57 @@ class CardamomoPlayer(ctk.CTk):
         # Sistema de seguimiento de tiempo
         self.tracker = AudioTracker()
         
+        # Escáner de carpetas (resultados por lotes al hilo de Tk)
+        self.scanner = FolderScanner(
+            self.cache,
+            on_progress=lambda *args: self.after(0, self.on_scan_progress, *args),
+            on_finished=lambda *args: self.after(0, self.on_folder_scanned, *args),
+            on_error=lambda error: self.after(0, self.on_scan_error, error)
+        )
+        
         # Analizador de audio para visualización
         self.analyzer = AudioAnalyzer(num_bars=32)
         
+        # Análisis de audio en segundo plano (beats y tempo)
+        self.decoder = AudioDecoder()
+        if not self.decoder.ffmpeg:
+            print("⚠ ffmpeg no encontrado: ecualizador, crossfade, forma de onda y beats "
+                  "solo funcionarán con archivos WAV de 44.1 kHz")
+        self.beat_analyzer = BeatAnalyzer(self.decoder)
+        self.waveform_analyzer = WaveformAnalyzer(self.decoder)
+        
+        # Salida de audio: mixer.music o canal por bloques con ecualizador
+        eq_settings = self.cache.settings.get('equalizer', {})
+        self.equalizer = Equalizer(
+            gains=eq_settings.get('gains'),
+            enabled=eq_settings.get('enabled', False)
+        )
+        self.equalizer_window = None
+        
+        # Canales reservados: Sound.play() no los usará
+        pygame.mixer.set_reserved(3)
+        self.output = PlaybackOutput(self.decoder, pygame.mixer.Channel(2), self.equalizer)
+        
+        # Fundido cruzado entre canciones
+        self.crossfade = CrossfadeEngine(
+            self.decoder,
+            self.output,
+            (pygame.mixer.Channel(0), pygame.mixer.Channel(1)),
+            seconds=self.cache.settings.get('crossfade', 0.0)
+        )
+        
+        # Precarga de las próximas canciones (discos lentos y de red)
+        self.prefetcher = TrackPrefetcher(
+            bandwidth=self.cache.settings.get('prefetch_bandwidth', 8 * 1024 * 1024)
+        )
+        
+        # Diario de sesión (pista, posición y modos)
+        self.journal = SessionJournal()
+        
         # Variables de estado
         self.current_index = -1
+        self.current_song = None
+        self.shuffle_queue = []
         self.is_paused = False
         self.shuffle_mode = False
         self.repeat_mode = False
@@ -439,11 +2656,14 @@ class CardamomoPlayer(ctk.CTk):
         
         # Mostrar estado inicial
         self.update_ui_state()
+        
+        # Retomar la sesión anterior antes de validar la biblioteca
+        self.after(0, self.resume_session)
 
     def setup_modern_ui(self):
         """Interfaz moderna"""
         self.title("🎵 Cardamomo Pro")
-        self.geometry("500x320")
+        self.geometry("500x345")
         self.resizable(False, False)
         
         # Fondo oscuro
@@ -473,6 +2693,9 @@ class CardamomoPlayer(ctk.CTk):
         
         # Controles
         self.setup_controls(main_frame)
+        
+        # Menú contextual (clic derecho)
+        self.setup_context_menu()
 
     def setup_header(self, parent):
         """Header"""
@@ -514,6 +2737,10 @@ class CardamomoPlayer(ctk.CTk):
         # Visualizador
         self.visualizer = CavaVisualizer(viz_frame, num_bars=32)
         self.visualizer.pack(fill="x", pady=5)
+        
+        # Clic en el visualizador: cambiar de modo
+        self.visualizer.canvas.bind("<Button-1>", self.toggle_visualizer_mode)
+        self.after_idle(self.visualizer.set_mode, self.cache.settings.get('visualizer', "bars"))
 
     def setup_song_info(self, parent):
         """Información de canción"""
@@ -557,6 +2784,19 @@ class CardamomoPlayer(ctk.CTk):
         progress_frame = ctk.CTkFrame(parent, fg_color="transparent")
         progress_frame.pack(fill="x", padx=20, pady=(0, 15))
         
+        # Forma de onda detrás del slider (una sola imagen)
+        self.waveform_canvas = tk.Canvas(
+            progress_frame,
+            bg="#151522",
+            highlightthickness=0,
+            height=30
+        )
+        self.waveform_canvas.pack(fill="x")
+        self.waveform_photo = None
+        self.waveform_item = None
+        self.waveform_ruta = None
+        self.waveform_canvas.bind("<Configure>", self.draw_waveform)
+        
         # Slider
         self.progress_slider = ctk.CTkSlider(
             progress_frame,
@@ -571,7 +2811,7 @@ class CardamomoPlayer(ctk.CTk):
             command=self.on_slider_changed
         )
         self.progress_slider.set(0)
-        self.progress_slider.pack()
+        self.progress_slider.place(relx=0.5, rely=0.5, anchor="center")
         
         # Eventos
         self.progress_slider.bind("<ButtonPress-1>", self.on_slider_press)
@@ -626,6 +2866,152 @@ class CardamomoPlayer(ctk.CTk):
                 elif text == "🔁":
                     self.repeat_button = btn
 
+    def setup_context_menu(self):
+        """Menú contextual con opciones extra"""
+        self.context_menu = tk.Menu(self, tearoff=0)
+        
+        # Playlists (se rellena al abrir el menú)
+        self.playlists_menu = tk.Menu(self.context_menu, tearoff=0, postcommand=self.update_playlists_menu)
+        self.context_menu.add_cascade(label="Playlists", menu=self.playlists_menu)
+        self.context_menu.add_separator()
+        
+        # Fundido cruzado
+        self.crossfade_var = tk.IntVar(value=int(self.crossfade.seconds))
+        crossfade_menu = tk.Menu(self.context_menu, tearoff=0)
+        for seconds in (0, 2, 4, 6, 8):
+            crossfade_menu.add_radiobutton(
+                label=f"{seconds} s" if seconds else "Desactivado",
+                value=seconds,
+                variable=self.crossfade_var,
+                command=self.set_crossfade
+            )
+        self.context_menu.add_cascade(label="Crossfade", menu=crossfade_menu)
+        self.context_menu.add_command(label="Ecualizador...", command=self.open_equalizer)
+        
+        # Modo del visualizador
+        self.visualizer_var = tk.StringVar(value=self.cache.settings.get('visualizer', "bars"))
+        visualizer_menu = tk.Menu(self.context_menu, tearoff=0)
+        for label, mode in (("Barras", "bars"), ("Cascada", "waterfall")):
+            visualizer_menu.add_radiobutton(
+                label=label,
+                value=mode,
+                variable=self.visualizer_var,
+                command=lambda: self.set_visualizer_mode(self.visualizer_var.get())
+            )
+        self.context_menu.add_cascade(label="Visualizador", menu=visualizer_menu)
+        self.context_menu.add_separator()
+        
+        self.context_menu.add_command(label="Importar playlist...", command=self.import_playlist)
+        self.context_menu.add_command(label="Exportar playlist...", command=self.export_playlist)
+        self.context_menu.add_command(label="Buscar duplicados", command=self.find_duplicates)
+        self.context_menu.add_command(label="Cancelar escaneo", command=self.cancel_scan)
+        
+        self.bind("<Button-3>", self.show_context_menu)
+        self.bind("<Escape>", self.cancel_scan)
+    
+    def set_crossfade(self):
+        """Cambia la duración del fundido cruzado"""
+        if not self.crossfade.active:
+            self.crossfade.cancel()
+        self.crossfade.seconds = float(self.crossfade_var.get())
+        self.cache.settings['crossfade'] = self.crossfade.seconds
+        
+        status = f"{self.crossfade.seconds:.0f} s" if self.crossfade.seconds else "OFF"
+        self.status_label.configure(text=f"Crossfade: {status}", text_color="#00cc66")
+    
+    def set_visualizer_mode(self, mode):
+        """Cambia el modo del visualizador"""
+        self.visualizer.set_mode(mode)
+        self.visualizer_var.set(mode)
+        self.cache.settings['visualizer'] = mode
+    
+    def toggle_visualizer_mode(self, event=None):
+        """Alterna barras / cascada"""
+        self.set_visualizer_mode("waterfall" if self.visualizer.mode == "bars" else "bars")
+    
+    def open_equalizer(self):
+        """Abre la ventana del ecualizador"""
+        if self.equalizer_window is not None and self.equalizer_window.winfo_exists():
+            self.equalizer_window.focus()
+            return
+        self.equalizer_window = EqualizerWindow(self)
+    
+    def equalizer_presets(self):
+        """Presets incluidos más los guardados por el usuario"""
+        presets = dict(Equalizer.PRESETS)
+        presets.update(self.cache.settings.get('equalizer_presets', {}))
+        return presets
+    
+    def set_equalizer_gain(self, band, gain):
+        """Cambia una banda (el filtro lo aplica en el siguiente bloque)"""
+        self.equalizer.set_gain(band, gain)
+        self.save_equalizer_settings()
+    
+    def apply_equalizer_preset(self, name):
+        """Aplica un preset del ecualizador"""
+        gains = self.equalizer_presets().get(name)
+        if gains is not None:
+            self.equalizer.set_gains(gains)
+            self.save_equalizer_settings(preset=name)
+    
+    def save_equalizer_preset(self, name):
+        """Guarda los ajustes actuales como preset"""
+        presets = self.cache.settings.setdefault('equalizer_presets', {})
+        presets[name] = list(self.equalizer.gains)
+        self.save_equalizer_settings(preset=name)
+        self.cache.save()
+    
+    def save_equalizer_settings(self, preset=None):
+        """Guarda el estado del ecualizador en la caché"""
+        settings = self.cache.settings.setdefault('equalizer', {})
+        settings['enabled'] = self.equalizer.enabled
+        settings['gains'] = list(self.equalizer.gains)
+        if preset is not None:
+            settings['preset'] = preset
+    
+    def set_equalizer_enabled(self, enabled):
+        """Activa o desactiva el ecualizador sin perder la posición"""
+        if enabled == self.equalizer.enabled:
+            return
+        
+        self.equalizer.enabled = enabled
+        self.save_equalizer_settings()
+        
+        # Cambiar de salida continuando en el mismo punto
+        if self.current_song is not None and (self.output.get_busy() or self.is_paused or self.crossfade.active):
+            self.crossfade.cancel()
+            self.output.load(self.current_song['ruta'], start=self.tracker.get_position())
+            self.output.play()
+            if self.is_paused:
+                self.output.pause()
+        
+        status = "ON" if enabled else "OFF"
+        self.status_label.configure(text=f"Ecualizador: {status}", text_color="#00cc66")
+    
+    def update_playlists_menu(self):
+        """Reconstruye el submenú de playlists"""
+        self.playlists_menu.delete(0, "end")
+        
+        self.active_playlist_var = tk.StringVar(value=self.cache.active_name)
+        for name in self.cache.playlist_names:
+            self.playlists_menu.add_radiobutton(
+                label=name,
+                value=name,
+                variable=self.active_playlist_var,
+                command=lambda name=name: self.switch_playlist(name)
+            )
+        
+        self.playlists_menu.add_separator()
+        self.playlists_menu.add_command(label="Nueva playlist...", command=self.create_playlist)
+        self.playlists_menu.add_command(label="Eliminar playlist actual", command=self.delete_playlist)
+    
+    def show_context_menu(self, event):
+        """Muestra el menú contextual"""
+        try:
+            self.context_menu.tk_popup(event.x_root, event.y_root)
+        finally:
+            self.context_menu.grab_release()
+
     # --- CONTROL DE BARRA DE PROGRESO ---
     def on_slider_press(self, event):
         """Usuario presiona la barra"""
@@ -634,26 +3020,28 @@ class CardamomoPlayer(ctk.CTk):
 
     def on_slider_release(self, event):
         """Usuario suelta la barra"""
-        if self.user_seeking and self.cache.playlist and self.current_index >= 0:
+        playlist = self.cache.playlist
+        if self.user_seeking and 0 <= self.current_index < len(playlist):
             value = self.progress_slider.get()
-            song = self.cache.playlist[self.current_index]
+            song = playlist[self.current_index]
             duration = song.get('duracion', 180)
             
             if duration > 0:
                 new_position = (value / 100.0) * duration
                 self.tracker.seek(new_position)
                 
+                # Un salto invalida el fundido preparado (o en curso)
+                was_fading = self.crossfade.active
+                self.crossfade.cancel()
+                
                 try:
-                    if pygame.mixer.music.get_busy():
-                        pygame.mixer.music.stop()
-                        time.sleep(0.05)
-                        pygame.mixer.music.play(start=new_position)
-                except:
-                    try:
-                        pygame.mixer.music.rewind()
-                        pygame.mixer.music.set_pos(new_position)
-                    except:
-                        pass
+                    if was_fading or self.output.get_busy():
+                        self.output.load(song['ruta'], start=new_position)
+                        self.output.play()
+                        if self.is_paused:
+                            self.output.pause()
+                except Exception as e:
+                    print(f"Error saltando: {e}")
                 
                 self.update_time_display(new_position, duration)
         
@@ -663,6 +3051,42 @@ class CardamomoPlayer(ctk.CTk):
     def on_slider_changed(self, value):
         pass
 
+    def draw_waveform(self, event=None):
+        """Dibuja la forma de onda de la canción actual"""
+        song = self.current_song
+        peaks = self.waveform_analyzer.get(song['ruta']) if song else None
+        
+        width = self.waveform_canvas.winfo_width()
+        height = self.waveform_canvas.winfo_height()
+        if peaks is None or peaks.shape[1] == 0 or width < 10 or height < 4:
+            if self.waveform_item is not None:
+                self.waveform_canvas.delete(self.waveform_item)
+                self.waveform_item = None
+            self.waveform_ruta = None
+            return
+        
+        # Solo se remuestrean los picos en caché (nunca se decodifica de nuevo)
+        peaks = self.waveform_analyzer.resample(peaks[0], peaks[1], width)
+        columns = np.linspace(0, peaks.shape[1] - 1, width).astype(int)
+        center = (height - 1) / 2
+        top = center - peaks[1, columns] * center
+        bottom = center - peaks[0, columns] * center
+        
+        rows = np.arange(height)[:, None]
+        mask = (rows >= np.floor(top)) & (rows <= np.ceil(bottom))
+        
+        rgb = np.empty((height, width, 3), dtype=np.uint8)
+        rgb[:] = (0x15, 0x15, 0x22)
+        rgb[mask] = (0x1e, 0x5c, 0x44)
+        
+        self.waveform_photo = tk.PhotoImage(master=self, data=ppm_data(rgb), format="PPM")
+        if self.waveform_item is None:
+            self.waveform_item = self.waveform_canvas.create_image(0, 0, anchor="nw", image=self.waveform_photo)
+            self.waveform_canvas.tag_lower(self.waveform_item)
+        else:
+            self.waveform_canvas.itemconfig(self.waveform_item, image=self.waveform_photo)
+        self.waveform_ruta = song['ruta']
+
     def update_time_display(self, current, total):
         """Actualiza el display de tiempo"""
         current_str = time.strftime('%M:%S', time.gmtime(current))
@@ -685,6 +3109,7 @@ class CardamomoPlayer(ctk.CTk):
         self.viz_thread.start()
         
         self.after(1000, self.check_track_end)
+        self.after(3000, self.journal_loop)
 
     def update_progress_loop(self):
         """Bucle de actualización de progreso"""
@@ -702,25 +3127,74 @@ class CardamomoPlayer(ctk.CTk):
 
     def update_progress_ui(self, current_pos):
         """Actualiza la UI de progreso"""
-        if self.current_index >= 0 and self.cache.playlist:
-            song = self.cache.playlist[self.current_index]
+        # Dibujar la forma de onda en cuanto esté analizada
+        song = self.current_song
+        if song and self.waveform_ruta != song['ruta'] and self.waveform_analyzer.get(song['ruta']) is not None:
+            self.draw_waveform()
+        
+        # Una sola lectura de la versión publicada: el escáner puede publicar otra
+        playlist = self.cache.playlist
+        if 0 <= self.current_index < len(playlist):
+            song = playlist[self.current_index]
             duration = song.get('duracion', 180)
             
             if duration > 0:
                 self.update_time_display(current_pos, duration)
                 
+                if self.crossfade.seconds > 0 and not self.crossfade.active:
+                    remaining = duration - current_pos
+                    if remaining <= self.crossfade.seconds and self.crossfade.is_prepared:
+                        self.start_crossfade()
+                        return
+                    if remaining <= self.crossfade.seconds + self.crossfade.lead_time:
+                        self.prepare_crossfade(duration, remaining)
+                
                 if current_pos >= duration - 0.5:
                     self.on_track_end()
 
+    def prepare_crossfade(self, duration, remaining):
+        """Decodifica por adelantado la transición a la siguiente canción"""
+        seconds = self.crossfade.seconds
+        key = (self.current_index, self.current_song['ruta'])
+        if self.crossfade.prepared_for == key or remaining <= seconds or duration < 2 * seconds:
+            return
+        
+        playlist = self.cache.playlist
+        index = self.current_index if self.repeat_mode else self.peek_next_index(playlist)
+        if not 0 <= index < len(playlist):
+            return
+        incoming = playlist[index]
+        if incoming.get('duracion', 180) < 2 * seconds:
+            return
+        
+        self.crossfade.prepare(key, self.current_song['ruta'], duration - seconds, incoming['ruta'], index)
+
+    def start_crossfade(self):
+        """Empieza el fundido hacia la canción preparada"""
+        playlist = self.cache.playlist
+        index = self.crossfade.next_index
+        if not (0 <= index < len(playlist)):
+            self.crossfade.cancel()
+            return
+        
+        self.crossfade.start()
+        self.set_current_track(index, playlist)
+
     def update_visualizer_loop(self):
         """Bucle de actualización del visualizador"""
         while self.running:
             try:
+                # Rejilla de beats de la canción actual (si ya está analizada)
+                song = self.current_song
+                beats = self.beat_analyzer.get(song['ruta']) if song else None
+                
                 # Obtener datos del analizador
                 heights, colors = self.analyzer.simulate_audio_data(
                     self.tracker.is_playing,
                     self.is_paused,
-                    volume=1.0
+                    volume=1.0,
+                    beat_times=beats[0] if beats else None,
+                    position=self.tracker.get_position()
                 )
                 
                 # Actualizar visualizador
@@ -754,35 +3228,112 @@ class CardamomoPlayer(ctk.CTk):
         if not folder:
             return
         
-        self.status_label.configure(text="Buscando archivos...", text_color="#ffcc00")
+        if self.scanner.request(folder):
+            self.status_label.configure(text="Buscando archivos...", text_color="#ffcc00")
+
+    def handle_remote(self, paths, commands):
+        """Rutas y órdenes recibidas de otra instancia o de la línea de comandos"""
+        queued = [path for path in paths if isinstance(path, str) and self.scanner.request(path)]
+        if queued:
+            self.status_label.configure(text="Buscando archivos...", text_color="#ffcc00")
+        
+        actions = {'play-pause': self.play_pause, 'next': self.next_track, 'prev': self.previous_track}
+        for command in commands:
+            action = actions.get(command)
+            if action is not None:
+                action()
+        
+        # Volver a lanzar el reproductor (aun sin archivos) trae la ventana al frente
+        self.deiconify()
+        self.lift()
+
+    def import_playlist(self):
+        """Importa una playlist M3U/PLS/XSPF a la playlist activa"""
+        path = filedialog.askopenfilename(
+            title="Importar playlist",
+            initialdir=os.path.expanduser("~"),
+            filetypes=[("Playlists", "*.m3u *.m3u8 *.pls *.xspf"), ("Todos los archivos", "*.*")]
+        )
+        
+        if not path:
+            return
+        
+        # Mismo flujo que las carpetas: progreso por lotes y cancelable
+        if self.scanner.request(path):
+            self.status_label.configure(text="Importando playlist...", text_color="#ffcc00")
+
+    def export_playlist(self):
+        """Exporta la playlist activa a M3U/PLS/XSPF"""
+        playlist = self.cache.playlist
+        if not playlist:
+            self.status_label.configure(text="Agrega música primero", text_color="#ff3333")
+            return
+        
+        path = filedialog.asksaveasfilename(
+            title="Exportar playlist",
+            initialdir=os.path.expanduser("~"),
+            initialfile=f"{playlist.name}.m3u8",
+            defaultextension=".m3u8",
+            filetypes=[("M3U8", "*.m3u8"), ("M3U", "*.m3u"), ("PLS", "*.pls"), ("XSPF", "*.xspf")]
+        )
+        
+        if not path:
+            return
+        
+        self.status_label.configure(text="Exportando playlist...", text_color="#ffcc00")
         
-        thread = threading.Thread(target=self.scan_folder, args=(folder,), daemon=True)
+        # La versión publicada no cambia: se puede recorrer fuera del hilo de Tk
+        thread = threading.Thread(target=self.write_playlist, args=(path, playlist), daemon=True)
         thread.start()
 
-    def scan_folder(self, folder):
-        """Escanea carpeta en segundo plano"""
+    def write_playlist(self, path, playlist):
+        """Escribe la playlist en segundo plano"""
         try:
-            extensions = {'.mp3', '.wav', '.ogg', '.flac', '.m4a', '.aac'}
-            new_songs = 0
-            
-            for root, dirs, files in os.walk(folder):
-                for file in files:
-                    if os.path.splitext(file)[1].lower() in extensions:
-                        filepath = os.path.join(root, file)
-                        if self.cache.add_song(filepath):
-                            new_songs += 1
-            
-            self.cache.save()
-            self.after(0, self.on_folder_scanned, new_songs)
-            
+            start = time.time()
+            count = PlaylistFile(FolderScanner.EXTENSIONS).write(path, playlist)
+            print(f"✓ Playlist exportada: {count} canciones en {time.time() - start:.2f}s → {path}")
+            self.after(0, self.on_playlist_exported, count)
         except Exception as e:
-            self.after(0, self.on_scan_error, str(e))
+            print(f"✗ Error exportando playlist: {e}")
+            self.after(0, self.on_playlist_exported, None)
+
+    def on_playlist_exported(self, count):
+        """Resultado de la exportación"""
+        if count is None:
+            self.status_label.configure(text="✗ Error exportando", text_color="#ff3333")
+        else:
+            self.status_label.configure(text=f"✓ {count} canciones exportadas", text_color="#00cc66")
+
+    def cancel_scan(self, event=None):
+        """Cancela el escaneo en curso"""
+        if self.scanner.is_scanning:
+            self.scanner.cancel()
+            self.status_label.configure(text="Cancelando...", text_color="#ffcc00")
+
+    def on_scan_progress(self, new_songs, found):
+        """Resultados parciales del escaneo"""
+        if not self.scanner.is_scanning:
+            return
+        
+        self.status_label.configure(
+            text=f"Buscando... {new_songs} nuevas ({found})",
+            text_color="#ffcc00"
+        )
+        
+        # Empezar a reproducir sin esperar al final del escaneo
+        if self.current_index == -1 and self.cache.playlist:
+            self.play_track(0)
 
-    def on_folder_scanned(self, new_songs):
+    def on_folder_scanned(self, new_songs, cancelled=False):
         """Cuando se completa el escaneo"""
         total = len(self.cache.playlist)
         
-        if new_songs > 0:
+        if cancelled:
+            self.status_label.configure(
+                text=f"Escaneo cancelado • {new_songs} nuevas",
+                text_color="#ffcc00"
+            )
+        elif new_songs > 0:
             self.status_label.configure(
                 text=f"✓ {new_songs} nuevas • {total} total", 
                 text_color="#00cc66"
@@ -803,64 +3354,204 @@ class CardamomoPlayer(ctk.CTk):
         self.status_label.configure(text="✗ Error escaneando", text_color="#ff3333")
         print(f"Error escaneando: {error}")
 
+    def find_duplicates(self):
+        """Busca canciones duplicadas en segundo plano"""
+        if len(self.cache.playlist) < 2:
+            self.status_label.configure(text="✓ Sin duplicados", text_color="#00cc66")
+            return
+        
+        self.status_label.configure(text="Buscando duplicados...", text_color="#ffcc00")
+        
+        songs = list(self.cache.playlist)
+        thread = threading.Thread(target=self.scan_duplicates, args=(songs,), daemon=True)
+        thread.start()
+
+    def scan_duplicates(self, songs):
+        """Detecta duplicados en segundo plano"""
+        try:
+            finder = DuplicateFinder()
+            start = time.time()
+            groups = finder.find(songs)
+            
+            print(f"✓ Duplicados: {len(groups)} grupos en {time.time() - start:.2f}s "
+                  f"({finder.files_sampled} muestreados, {finder.files_fully_hashed} completos, "
+                  f"{finder.bytes_hashed / 1e6:.1f} MB leídos)")
+            for group in groups:
+                print("  = " + "\n    ".join(group))
+            
+            self.after(0, self.on_duplicates_found, groups)
+            
+        except Exception as e:
+            self.after(0, self.on_scan_error, str(e))
+
+    def on_duplicates_found(self, groups):
+        """Cuando termina la búsqueda de duplicados"""
+        if not groups:
+            self.status_label.configure(text="✓ Sin duplicados", text_color="#00cc66")
+            return
+        
+        copies = sum(len(group) - 1 for group in groups)
+        if not messagebox.askyesno(
+            "Duplicados",
+            f"Se encontraron {copies} copias en {len(groups)} grupos.\n"
+            "¿Quitarlas de la playlist?"
+        ):
+            self.update_ui_state()
+            return
+        
+        # Conservar la canción actual aunque cambie su índice
+        current = None
+        playlist = self.cache.playlist
+        if 0 <= self.current_index < len(playlist):
+            current = playlist[self.current_index]['ruta']
+        
+        removed = self.cache.collapse_duplicates(groups)
+        self.cache.save()
+        
+        rutas = [song['ruta'] for song in self.cache.playlist]
+        if current not in rutas:
+            # La canción actual era una copia: seguir con la que se conservó
+            current = next((ruta for group in groups if current in group
+                            for ruta in group if ruta in rutas), None)
+        if current in rutas:
+            self.current_index = rutas.index(current)
+        elif self.current_index >= len(rutas):
+            self.current_index = len(rutas) - 1
+        
+        # La fila actual puede ser la copia quitada: apuntar a la conservada
+        if self.current_song is not None and 0 <= self.current_index < len(rutas):
+            self.current_song = self.cache.playlist[self.current_index]
+        
+        self.update_ui_state()
+        self.status_label.configure(text=f"✓ {removed} duplicados quitados", text_color="#00cc66")
+
     def clear_playlist(self):
         """Limpia toda la playlist"""
         if not self.cache.playlist:
             return
         
         if messagebox.askyesno("Limpiar playlist", "¿Eliminar todas las canciones?"):
-            if pygame.mixer.music.get_busy():
-                pygame.mixer.music.stop()
+            self.stop_playback()
             
-            self.cache.playlist.clear()
+            self.cache.clear()
             self.cache.save()
-            self.current_index = -1
-            self.is_paused = False
-            self.tracker.stop()
-            self.play_button.configure(text="▶")
-            
-            self.song_name_var.set("No hay música seleccionada")
-            self.current_time_var.set("00:00")
-            self.total_time_var.set("/ 00:00")
-            self.progress_slider.set(0)
             
             self.update_ui_state()
             self.status_label.configure(text="Playlist limpiada", text_color="#00cc66")
 
-    def play_track(self, index):
+    def stop_playback(self):
+        """Detiene la reproducción y reinicia la UI"""
+        self.crossfade.cancel()
+        self.output.stop()
+        
+        self.current_index = -1
+        self.current_song = None
+        self.is_paused = False
+        self.tracker.stop()
+        self.play_button.configure(text="▶")
+        
+        self.song_name_var.set("No hay música seleccionada")
+        self.current_time_var.set("00:00")
+        self.total_time_var.set("/ 00:00")
+        self.progress_slider.set(0)
+        self.draw_waveform()
+
+    def switch_playlist(self, name):
+        """Activa otra playlist"""
+        if not self.cache.switch_playlist(name):
+            return
+        
+        self.stop_playback()
+        self.update_ui_state()
+        self.status_label.configure(text=f"Playlist: {name}", text_color="#00cc66")
+
+    def create_playlist(self):
+        """Crea una playlist nueva y la activa"""
+        dialog = ctk.CTkInputDialog(text="Nombre de la playlist:", title="Nueva playlist")
+        name = (dialog.get_input() or "").strip()
+        
+        if not self.cache.create_playlist(name):
+            if name:
+                self.status_label.configure(text="✗ Esa playlist ya existe", text_color="#ff3333")
+            return
+        
+        self.stop_playback()
+        self.update_ui_state()
+        self.status_label.configure(text=f"Playlist: {name}", text_color="#00cc66")
+
+    def delete_playlist(self):
+        """Elimina la playlist activa"""
+        name = self.cache.active_name
+        if len(self.cache.playlist_names) == 1:
+            self.status_label.configure(text="✗ Es la única playlist", text_color="#ff3333")
+            return
+        
+        if messagebox.askyesno("Eliminar playlist", f"¿Eliminar la playlist '{name}'?"):
+            self.cache.delete_playlist(name)
+            self.stop_playback()
+            self.update_ui_state()
+            self.status_label.configure(text=f"Playlist: {self.cache.active_name}", text_color="#00cc66")
+
+    def play_track(self, index, start=0.0):
         """Reproduce una canción específica"""
-        if not (0 <= index < len(self.cache.playlist)):
+        playlist = self.cache.playlist
+        if not (0 <= index < len(playlist)):
             return
         
         try:
-            if pygame.mixer.music.get_busy():
-                pygame.mixer.music.stop()
-                time.sleep(0.05)
-            
-            self.current_index = index
-            song = self.cache.playlist[index]
-            duration = song.get('duracion', 180)
-            
-            self.tracker.start(duration)
-            
-            pygame.mixer.music.load(song['ruta'])
-            pygame.mixer.music.play()
+            self.crossfade.cancel()
             
-            self.is_paused = False
-            self.play_button.configure(text="⏸")
+            if self.output.get_busy():
+                self.output.stop()
+                time.sleep(0.05)
             
-            song_name = song.get('nombre', os.path.basename(song['ruta']))
-            self.song_name_var.set(f"▶ {song_name[:40]}{'...' if len(song_name) > 40 else ''}")
+            song = self.set_current_track(index, playlist)
+            ruta = song['ruta']
             
-            self.progress_slider.set(0)
-            self.update_time_display(0, duration)
+            # Tiempo hasta el primer audio: desde la carga hasta que suena
+            warm = self.prefetcher.is_warm(ruta)
+            started = time.perf_counter()
+            self.output.load(ruta, start=start)
+            self.output.play(on_first_audio=lambda: self.prefetcher.record(
+                ruta, warm, time.perf_counter() - started))
             
-            self.status_label.configure(text="Reproduciendo", text_color="#00cc66")
+            if start > 0:
+                self.tracker.seek(start)
+                self.update_time_display(start, song.get('duracion', 180))
             
         except Exception as e:
             self.status_label.configure(text="✗ Error reproduciendo", text_color="#ff3333")
             print(f"Error reproduciendo: {e}")
 
+    def set_current_track(self, index, playlist):
+        """Marca la canción actual y actualiza la UI"""
+        self.current_index = index
+        if self.shuffle_queue and self.shuffle_queue[0] == index:
+            # Sonó la siguiente del orden aleatorio: el resto del orden se mantiene
+            self.shuffle_queue.pop(0)
+        song = playlist[index]
+        duration = song.get('duracion', 180)
+        
+        self.current_song = song
+        self.beat_analyzer.request(song['ruta'])
+        self.waveform_analyzer.request(song['ruta'])
+        self.draw_waveform()
+        
+        self.tracker.start(duration)
+        
+        self.is_paused = False
+        self.play_button.configure(text="⏸")
+        
+        song_name = song.get('nombre', os.path.basename(song['ruta']))
+        self.song_name_var.set(f"▶ {song_name[:40]}{'...' if len(song_name) > 40 else ''}")
+        
+        self.progress_slider.set(0)
+        self.update_time_display(0, duration)
+        
+        self.status_label.configure(text="Reproduciendo", text_color="#00cc66")
+        self.prefetch_upcoming(playlist)
+        return song
+
     def play_pause(self):
         """Controla play/pause"""
         if not self.cache.playlist:
@@ -870,13 +3561,15 @@ class CardamomoPlayer(ctk.CTk):
         if self.current_index < 0:
             self.play_track(0)
         elif self.is_paused:
-            pygame.mixer.music.unpause()
+            self.output.unpause()
+            self.crossfade.resume()
             self.tracker.resume()
             self.is_paused = False
             self.play_button.configure(text="⏸")
             self.status_label.configure(text="Reproduciendo", text_color="#00cc66")
-        elif pygame.mixer.music.get_busy():
-            pygame.mixer.music.pause()
+        elif self.output.get_busy() or self.crossfade.active:
+            self.output.pause()
+            self.crossfade.pause()
             self.tracker.pause()
             self.is_paused = True
             self.play_button.configure(text="▶")
@@ -886,31 +3579,56 @@ class CardamomoPlayer(ctk.CTk):
 
     def next_track(self):
         """Siguiente canción"""
-        if not self.cache.playlist:
+        playlist = self.cache.playlist
+        if not playlist:
             return
         
+        self.play_track(self.peek_next_index(playlist))
+
+    def peek_next_index(self, playlist):
+        """Índice de la siguiente canción (se mantiene hasta que suene)"""
+        return self.upcoming_indices(playlist, 1)[0]
+
+    def upcoming_indices(self, playlist, count):
+        """Próximas canciones en orden de cola o aleatorio"""
         if self.shuffle_mode:
-            index = random.randint(0, len(self.cache.playlist) - 1)
-        else:
-            index = (self.current_index + 1) % len(self.cache.playlist)
+            # El orden aleatorio se fija por adelantado para poder precargarlo
+            order = [i for i in self.shuffle_queue if i < len(playlist)]
+            while len(order) < count:
+                order.append(random.randint(0, len(playlist) - 1))
+            self.shuffle_queue = order
+            return order[:count]
+        
+        return [(self.current_index + step) % len(playlist) for step in range(1, count + 1)]
+
+    def prefetch_upcoming(self, playlist=None):
+        """Pide la precarga de lo que va a sonar después"""
+        playlist = playlist if playlist is not None else self.cache.playlist
+        if not (0 <= self.current_index < len(playlist)):
+            return
         
-        self.play_track(index)
+        if self.repeat_mode:
+            indices = [self.current_index]
+        else:
+            indices = self.upcoming_indices(playlist, 2)
+        self.prefetcher.request(playlist[i]['ruta'] for i in indices)
 
     def previous_track(self):
         """Canción anterior"""
-        if not self.cache.playlist:
+        count = len(self.cache.playlist)
+        if not count:
             return
         
         if self.shuffle_mode:
-            index = random.randint(0, len(self.cache.playlist) - 1)
+            index = random.randint(0, count - 1)
         else:
-            index = (self.current_index - 1) % len(self.cache.playlist)
+            index = (self.current_index - 1) % count
         
         self.play_track(index)
 
     def update_playback_status(self):
         """Actualiza el estado de reproducción"""
-        if pygame.mixer.music.get_busy() and not self.is_paused:
+        if self.output.get_busy() and not self.is_paused:
             self.status_label.configure(text="Reproduciendo", text_color="#00cc66")
         elif self.is_paused:
             self.status_label.configure(text="Pausado", text_color="#ffcc00")
@@ -927,11 +3645,11 @@ class CardamomoPlayer(ctk.CTk):
     def check_track_end(self):
         """Verifica si la canción terminó"""
         try:
+            playlist = self.cache.playlist
             if (self.tracker.is_playing and 
-                self.current_index >= 0 and
-                self.cache.playlist):
+                0 <= self.current_index < len(playlist)):
                 
-                song = self.cache.playlist[self.current_index]
+                song = playlist[self.current_index]
                 duration = song.get('duracion', 180)
                 
                 if self.tracker.get_position() >= duration - 0.5:
@@ -943,9 +3661,104 @@ class CardamomoPlayer(ctk.CTk):
         if self.running:
             self.after(1000, self.check_track_end)
 
+    # --- SESIÓN ---
+    def journal_loop(self):
+        """Guarda la sesión cada pocos segundos"""
+        try:
+            self.save_session()
+        except Exception as e:
+            print(f"Error en journal_loop: {e}")
+        
+        if self.running:
+            self.after(3000, self.journal_loop)
+
+    def save_session(self):
+        """Escribe el estado actual en el diario"""
+        song = self.current_song
+        if song is None:
+            self.journal.write(None, SessionJournal.NO_TRACK, 0, self.cache.active_name,
+                               0.0, 0.0, self.shuffle_mode, self.repeat_mode, False)
+        else:
+            self.journal.write(song['ruta'], song.track_id, self.current_index, self.cache.active_name,
+                               self.tracker.get_position(), song.get('duracion', 180),
+                               self.shuffle_mode, self.repeat_mode, self.is_paused)
+
+    def resume_session(self):
+        """Vuelve a la última canción y posición"""
+        try:
+            state = self.journal.read()
+            if (state and not state['ruta'] and
+                    state['track_id'] != SessionJournal.NO_TRACK and
+                    state['track_id'] < len(self.cache.tracks)):
+                # La ruta no cabía en el registro: se toma de la tabla por ID
+                state['ruta'] = self.cache.tracks.path(state['track_id'])
+            
+            if state and state['ruta'] and os.path.exists(state['ruta']):
+                if state['playlist'] in self.cache.playlist_names:
+                    self.cache.switch_playlist(state['playlist'])
+                
+                # El índice guardado suele ser válido; si no, se busca por ruta
+                index = state['index']
+                playlist = self.cache.playlist
+                if not (index < len(playlist) and playlist[index]['ruta'] == state['ruta']):
+                    track_id = self.cache.tracks.find(state['ruta'])
+                    index = playlist.ids.index(track_id) if track_id in playlist.members else -1
+                
+                if index >= 0:
+                    if state['shuffle'] != self.shuffle_mode:
+                        self.toggle_shuffle()
+                    if state['repeat'] != self.repeat_mode:
+                        self.toggle_repeat()
+                    
+                    position = state['position']
+                    if position >= state['duration'] - 1:
+                        position = 0.0
+                    
+                    self.play_track(index, start=position)
+                    if state['paused']:
+                        self.play_pause()
+                    
+                    self.status_label.configure(text="Sesión restaurada", text_color="#00cc66")
+                    
+        except Exception as e:
+            print(f"✗ Error restaurando sesión: {e}")
+        
+        # Validar la biblioteca en segundo plano, después de sonar
+        threading.Thread(target=self.validate_library, daemon=True).start()
+
+    def validate_library(self):
+        """Busca archivos que ya no existen"""
+        try:
+            missing = self.cache.find_missing()
+            if missing:
+                self.after(0, self.on_library_validated, missing)
+        except Exception as e:
+            print(f"Error validando biblioteca: {e}")
+
+    def on_library_validated(self, missing):
+        """Quita de la playlist las canciones que ya no existen"""
+        current = self.current_song.track_id if self.current_song is not None else None
+        removed = self.cache.remove_ids(missing)
+        if not removed:
+            return
+        
+        # El índice actual se recalcula porque la playlist se ha desplazado
+        playlist = self.cache.playlist
+        if current is not None and current in playlist.members:
+            self.current_index = playlist.ids.index(current)
+        elif current is not None:
+            self.current_index = min(self.current_index, len(playlist) - 1)
+        
+        print(f"⚠ {removed} canciones ya no existen y se quitaron de la playlist")
+        self.update_ui_state()
+
     def toggle_shuffle(self):
         """Activa/desactiva modo aleatorio"""
         self.shuffle_mode = not self.shuffle_mode
+        self.shuffle_queue = []
+        if self.crossfade.is_prepared:
+            self.crossfade.cancel()
+        self.prefetch_upcoming()
         color = "#00cc66" if self.shuffle_mode else "#252536"
         self.shuffle_button.configure(fg_color=color)
         
@@ -958,6 +3771,9 @@ class CardamomoPlayer(ctk.CTk):
     def toggle_repeat(self):
         """Activa/desactiva modo repetir"""
         self.repeat_mode = not self.repeat_mode
+        if self.crossfade.is_prepared:
+            self.crossfade.cancel()
+        self.prefetch_upcoming()
         color = "#00cc66" if self.repeat_mode else "#252536"
         self.repeat_button.configure(fg_color=color)
         
@@ -971,20 +3787,49 @@ class CardamomoPlayer(ctk.CTk):
         """Maneja el cierre de la aplicación"""
         self.running = False
         
+        self.save_session()
+        self.journal.close()
         self.cache.save()
         
-        if pygame.mixer.music.get_busy():
-            pygame.mixer.music.stop()
+        self.crossfade.cancel()
+        self.output.stop()
+        
+        if self.equalizer.blocks_processed:
+            print(f"✓ {self.equalizer.report()}")
+        print(f"✓ {self.prefetcher.report()}")
         
         time.sleep(0.1)
         self.destroy()
 
-def main():
+def main(args=None):
     """Función principal"""
+    args = args or parse_args()
+    
+    # Reclamar la instancia única antes de abrir el dispositivo de audio
+    instance = SingleInstance()
+    if not args.new_instance and not instance.listen():
+        # Otra instancia arrancó a la vez y ganó el socket
+        instance.send(args.paths, args.commands)
+        return
+    
     try:
         print("🎵 Iniciando Cardamomo Pro...")
         
+        # CONFIGURACIÓN DE PYGAME
+        if not pygame.get_init():
+            pygame.mixer.pre_init(
+                frequency=44100,
+                size=-16,
+                channels=2,
+                buffer=4096,
+                allowedchanges=0
+            )
+            pygame.init()
+        
         app = CardamomoPlayer()
+        instance.serve(lambda paths, commands: app.after(0, app.handle_remote, paths, commands))
+        if args.paths or args.commands:
+            app.after(0, app.handle_remote, args.paths, args.commands)
         app.mainloop()
         
     except Exception as e:
@@ -992,8 +3837,9 @@ def main():
         import traceback
         traceback.print_exc()
     finally:
+        instance.close()
         pygame.quit()
         print("👋 Cardamomo cerrado")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main(ARGS)
\ No newline at end of file